@@ -2,33 +2,138 @@
 
 from __future__ import absolute_import, annotations, division, print_function
 
-import argparse
+import collections
+import contextlib
+import errno
+import functools
+import itertools
 import logging
 import os
 import re
+import struct
+import sys
+import threading
 import time
 from collections.abc import Callable
 from enum import Enum, unique
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    ContextManager,
+    Deque,
+    Dict,
+    FrozenSet,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
 
-from rich.console import Console
-from rich.logging import RichHandler
-from rich.progress import BarColumn, Progress, SpinnerColumn, TimeRemainingColumn
+# rich, asyncio, sqlite3, concurrent.futures and friends are imported where they
+# are used, so that importing cesp or running it with -q stays fast
+if TYPE_CHECKING:
+    from concurrent.futures import (
+        Executor,
+        Future,
+        ProcessPoolExecutor,
+        ThreadPoolExecutor,
+    )
+
+    from rich.console import Console
 
 listStr = List[str]
-RENAME_DELAY = 0.1
+RenameCallback = Callable[[int, str], None]
+_F = TypeVar("_F", bound=Callable[..., Any])
+# rename progress is reported every PROGRESS_BATCH_SIZE items or
+# PROGRESS_BATCH_INTERVAL seconds, whichever comes first
+PROGRESS_BATCH_SIZE = 256
+PROGRESS_BATCH_INTERVAL = 0.1
+# number of entries handed over at once between the event loop and the worker
+# threads by afetch and arename_list
+ASYNC_BATCH_SIZE = 256
+# number of converted names remembered by the converter
+NAME_CACHE_SIZE = 65536
+# with more than one process, names are converted in batches of
+# PROCESS_BATCH_SIZE by the process pool. Fewer names than that are not worth
+# the round trip and are converted in the main process.
+PROCESS_BATCH_SIZE = 4096
+# paths given on stdin are read STDIN_CHUNK_SIZE bytes at a time
+STDIN_CHUNK_SIZE = 1 << 20
+# first line of a rename plan file, every following line is a JSON
+# [original, renamed] pair
+PLAN_HEADER = ["cesp-plan", 1]
+# first line of a rename journal, see _RenameJournal
+JOURNAL_HEADER = ["cesp-journal", 1]
+# the journal is fsync'ed every JOURNAL_SYNC_EVERY recorded renames
+JOURNAL_SYNC_EVERY = 1024
+# clean directories are written to the scan index INDEX_FLUSH_EVERY at a time
+INDEX_FLUSH_EVERY = 1024
+# number of parent directories kept open by each rename batch, see _DirFds
+DIR_FD_CACHE_SIZE = 16
+# archive members are copied ARCHIVE_BUFFER_SIZE bytes at a time, and 7z
+# members bigger than ARCHIVE_SPOOL_SIZE are held in a temporary file instead
+# of in memory between reading and writing them
+ARCHIVE_BUFFER_SIZE = 1 << 20
+ARCHIVE_SPOOL_SIZE = 8 << 20
+ZIP_LOCAL_HEADER_SIZE = 30
+# number of durations kept by each stats timer to estimate its percentiles
+STATS_RESERVOIR_SIZE = 4096
+
+# survey() follows this many random paths from the root down, and reports
+# intervals at this many standard errors (95% confidence)
+SURVEY_PROBES = 1000
+SURVEY_Z = 1.96
+# watch mode waits for a burst of changes to be quiet for WATCH_DEBOUNCE seconds,
+# but never delays a rename pass for more than WATCH_MAX_DELAY seconds
+WATCH_DEBOUNCE = 0.5
+WATCH_MAX_DELAY = 5.0
+# how often the polling watcher checks the directories for changes, and how
+# often the inotify watcher wakes up to check whether it should stop
+WATCH_POLL_INTERVAL = 1.0
 
 __author__ = "Marcus Bruno Fernandes Silva"
 __maintainer__ = __author__
 __email__ = "marcusbfs@gmail.com"
 __version__ = "1.5.3"
 
-console = Console()
+_console: Optional[Console] = None
+
+_brackets_chars = "()[]{}"
 
 cesp_logger = logging.getLogger("cesp")
 root_logger = logging.getLogger("main")
 
 
+def _get_console() -> Console:
+    global _console
+    if _console is None:
+        from rich.console import Console
+
+        _console = Console()
+    return _console
+
+
+def __getattr__(name: str) -> Any:
+    # the console used to be created at import time
+    if name == "console":
+        return _get_console()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 @unique
 class ChangeItemMode(Enum):
     all = 1
@@ -36,69 +141,1285 @@ class ChangeItemMode(Enum):
     dirs = 3
 
 
+@unique
+class CollisionPolicy(Enum):
+    skip = 1
+    suffix = 2
+    abort = 3
+
+
+@unique
+class WatchBackend(Enum):
+    # inotify when available, polling otherwise
+    auto = 1
+    inotify = 2
+    poll = 3
+
+
+class Collision(NamedTuple):
+    original: str
+    # the name it should have been renamed to
+    target: str
+    # what it is renamed to instead, None when it is skipped
+    renamed: Optional[str]
+
+
+class CollisionError(ValueError):
+    def __init__(self, collisions: List[Collision]) -> None:
+        super().__init__("{} name collisions found.".format(len(collisions)))
+        self.collisions = collisions
+
+
+class PlanEntry(NamedTuple):
+    original: str
+    target: str
+    # "file" or "dir"
+    kind: str
+    # "convert", or "suffix" when the converted name was taken
+    reason: str = "convert"
+
+
+@unique
+class RenameStatus(Enum):
+    renamed = 1
+    # the target already exists, nothing was done
+    exists = 2
+    # os.rename raised, see RenameResult.error
+    failed = 3
+    # would have been renamed, but no-change mode is on
+    no_change = 4
+
+
+class RenameResult(NamedTuple):
+    entry: PlanEntry
+    status: RenameStatus
+    error: Optional[OSError] = None
+
+
+class RootReport(NamedTuple):
+    path: str
+    # entries listed while walking the root
+    scanned: int
+    renames: int
+    seconds: float
+    # set when the root could not be processed
+    error: Optional[Exception] = None
+
+
+class Estimate(NamedTuple):
+    value: float
+    # confidence interval, see SURVEY_Z
+    low: float
+    high: float
+
+
+class SurveyReport(NamedTuple):
+    path: str
+    probes: int
+    dirs_listed: int
+    seconds: float
+    # directories at each depth, the root is depth 0
+    dirs: List[Estimate]
+    # names fetch() would look at and would change
+    entries: Estimate
+    renames: Estimate
+    # names each rule would change, a name changed by several rules is
+    # counted by each of them
+    rules: Dict[str, Estimate]
+
+
+class TransliterationRules(NamedTuple):
+    # used by -u
+    utf_chars: Mapping[str, str]
+    # used by -s
+    special_chars: Mapping[str, str]
+    # the rule file they were loaded from, None for the built-in rules
+    source: Optional[str] = None
+
+
+class _DirScan(NamedTuple):
+    path: str
+    files: listStr
+    dirs: listStr
+    # absolute paths of the directories to descend into
+    subdirs: listStr
+    # hidden or ignored names, which still count for collisions
+    skipped: listStr
+    # (st_mtime_ns, st_ino, st_dev) taken before listing, only set when a scan
+    # index is in use and the directory was actually listed
+    stat: Optional[Tuple[int, int, int]] = None
+
+
+# Same output as _convertUTF, _convertDots, _convertBrackets, _removeSpecialChars
+# and _removeBlankSpaces applied in sequence, but with a single translate table
+# and a single regex pass
+class CompiledConverter:
+    _blank_re = re.compile(r"[\s_]+")
+    # characters whose position decides what _convertDots does
+    _dots_sensitive = frozenset({".", ",", os.sep, os.altsep or os.sep})
+
+    def __init__(
+        self,
+        utf_chars: Mapping[str, str],
+        special_chars: Mapping[str, str],
+        convert_utf: bool = False,
+        convert_dots: bool = False,
+        convert_brackets: bool = False,
+        remove_special_chars: bool = False,
+        cache_size: int = 0,
+    ) -> None:
+        self._args = (
+            utf_chars,
+            special_chars,
+            convert_utf,
+            convert_dots,
+            convert_brackets,
+            remove_special_chars,
+            cache_size,
+        )
+        late: Dict[str, str] = {}
+        if convert_brackets:
+            late = {c: "" for c in _brackets_chars}
+        if remove_special_chars:
+            late = self._compose(late, special_chars)
+        early = dict(utf_chars) if convert_utf else {}
+
+        self._convert_dots = convert_dots
+        self._early: Optional[Dict[int, str]] = None
+        if convert_dots and not self._commutes_with_dots(early):
+            # the UTF table touches dots/separators, keep the original order
+            self._early = str.maketrans(early) if early else None
+            self._table = str.maketrans(late)
+        else:
+            self._table = str.maketrans(self._compose(early, late))
+
+        # repeated names (Thumbs.db, cover.jpg, ...) are only converted once
+        self.convert: Callable[[str], str] = self._convert
+        if cache_size > 0:
+            self.convert = functools.lru_cache(maxsize=cache_size)(self._convert)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # the cache can not be pickled, the converter is compiled again from
+        # its arguments instead (worker processes)
+        utf_chars, special_chars, *options = self._args
+        return (CompiledConverter, (dict(utf_chars), dict(special_chars), *options))
+
+    def cache_info(self) -> Optional[Tuple[int, int, int]]:
+        # (hits, misses, currsize) or None when caching is disabled
+        info = getattr(self.convert, "cache_info", None)
+        if info is None:
+            return None
+        hits, misses, _, currsize = info()
+        return hits, misses, currsize
+
+    def _convert(self, name: str) -> str:
+        if self._early is not None:
+            name = name.translate(self._early)
+        if self._convert_dots and ("." in name or "," in name):
+            base_name, name_extension = os.path.splitext(name)
+            name = base_name.replace(".", "_").replace(",", "_") + name_extension
+        if self._table:
+            name = name.translate(self._table)
+        name = self._blank_re.sub("_", name).strip("_")
+        if "_." in name:
+            name = name.replace("_.", ".")
+        return name
+
+    @staticmethod
+    def _compose(first: Mapping[str, str], then: Mapping[str, str]) -> Dict[str, str]:
+        then_table = str.maketrans(dict(then))
+        composed = {k: v.translate(then_table) for k, v in first.items()}
+        for k, v in then.items():
+            composed.setdefault(k, v)
+        return composed
+
+    @classmethod
+    def _commutes_with_dots(cls, table: Mapping[str, str]) -> bool:
+        for k, v in table.items():
+            if not v or k == "_" or k in cls._dots_sensitive:
+                return False
+            if any(c in cls._dots_sensitive for c in v):
+                return False
+        return True
+
+
+# set in every converter worker process by _init_convert_worker
+_worker_converter: Optional[CompiledConverter] = None
+
+
+def _init_convert_worker(converter: CompiledConverter) -> None:
+    global _worker_converter
+    _worker_converter = converter
+
+
+def _convert_names(names: listStr) -> List[Optional[str]]:
+    # unchanged names are sent back as None, which is much cheaper to pickle
+    assert _worker_converter is not None
+    convert = _worker_converter.convert
+    converted: List[Optional[str]] = []
+    for name in names:
+        new_name = convert(name)
+        converted.append(new_name if new_name != name else None)
+    return converted
+
+
+# Remembers which directories had nothing to rename the last time they were
+# listed, so they are not listed again while their mtime/inode stay the same.
+# Rows are keyed by the converter options, changing any of them starts a fresh
+# index.
+class _ScanIndex:
+    # directories modified this close to the start of the scan may still get
+    # changes with the same mtime (coarse timestamps), so they are not recorded
+    racy_window_ns = 2_000_000_000
+
+    def __init__(self, filename: str, key: str) -> None:
+        import sqlite3
+
+        self._key = key
+        self._racy_after = time.time_ns() - self.racy_window_ns
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            " key TEXT NOT NULL,"
+            " path BLOB NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " ino INTEGER NOT NULL,"
+            " dev INTEGER NOT NULL,"
+            " subdirs BLOB NOT NULL,"
+            " PRIMARY KEY (key, path))"
+        )
+        # rows are looked up one directory at a time through the primary key
+        # and written INDEX_FLUSH_EVERY at a time, so the index is never held
+        # in memory. The scan threads share the connection under the lock.
+        self._lock = threading.Lock()
+        self._new: List[Tuple[str, bytes, int, int, int, bytes]] = []
+        self._saved = 0
+
+    def lookup(self, path: str, stat: Tuple[int, int, int]) -> Optional[listStr]:
+        with self._lock:
+            known = self._db.execute(
+                "SELECT mtime_ns, ino, dev, subdirs FROM dirs"
+                " WHERE key = ? AND path = ?",
+                (self._key, os.fsencode(path)),
+            ).fetchone()
+        if known is None or tuple(known[:3]) != stat:
+            return None
+        if not known[3]:
+            return []
+        return [os.fsdecode(name) for name in known[3].split(b"\0")]
+
+    def record(self, path: str, stat: Tuple[int, int, int], subdirs: listStr) -> None:
+        if stat[0] >= self._racy_after:
+            return
+        names = b"\0".join(os.fsencode(name) for name in subdirs)
+        with self._lock:
+            self._new.append((self._key, os.fsencode(path), *stat, names))
+            if len(self._new) >= INDEX_FLUSH_EVERY:
+                self._flush()
+
+    def save(self) -> int:
+        with self._lock:
+            self._flush()
+        return self._saved
+
+    def _flush(self) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?)", self._new
+            )
+        self._saved += len(self._new)
+        self._new.clear()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+# Append-only record of a rename run. The whole plan is written (and synced)
+# before the first rename as ["P", original, renamed] lines followed by a
+# ["B"] line; then every finished rename appends ["D", index] and every
+# reverted one ["U", index]. A streamed journal starts with ["B"] and plans
+# its renames a chunk at a time instead, each chunk synced before renaming it.
+class _RenameJournal:
+    def __init__(self, filename: str) -> None:
+        import json
+
+        self.filename = filename
+        self.plan: List[Tuple[str, str]] = []
+        self.done: Set[int] = set()
+        self.undone: Set[int] = set()
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._marker = "D"
+        self._sources: Dict[str, int] = {}
+        self._planned = 0
+        self._dumps = json.dumps
+
+    @classmethod
+    def create(cls, filename: str, pairs: List[Tuple[str, str]]) -> _RenameJournal:
+        journal = cls(filename)
+        journal.plan = pairs
+        journal._file = open(filename, "w", encoding="utf-8")
+        journal._write(JOURNAL_HEADER)
+        for f, new_f in pairs:
+            journal._write(["P", f, new_f])
+        journal._write(["B"])
+        journal._sync()
+        return journal
+
+    @classmethod
+    def stream(cls, filename: str) -> _RenameJournal:
+        # the plan is not kept in memory, see extend
+        journal = cls(filename)
+        journal._file = open(filename, "w", encoding="utf-8")
+        journal._write(JOURNAL_HEADER)
+        journal._write(["B"])
+        journal._sync()
+        return journal
+
+    def extend(self, pairs: List[Tuple[str, str]]) -> None:
+        # plans the next chunk of a streamed journal and tracks only its renames
+        sources = {}
+        for f, new_f in pairs:
+            self._write(["P", f, new_f])
+            sources[f] = self._planned
+            self._planned += 1
+        self._sync()
+        self.track("D", sources)
+
+    @classmethod
+    def load(cls, filename: str) -> _RenameJournal:
+        import json
+
+        journal = cls(filename)
+        started = False
+        with open(filename, "rb") as lines:
+            header = lines.readline()
+            try:
+                valid = json.loads(header or b"null") == JOURNAL_HEADER
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ValueError("Invalid journal file.")
+            # end of the last complete record
+            end = len(header)
+            for line in lines:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write at the end of an interrupted run
+                    break
+                end += len(line)
+                if not journal._add_record(record):
+                    raise ValueError("Invalid journal file.")
+                started = started or record[0] == "B"
+        if not started:
+            raise ValueError("Journal was interrupted before any rename.")
+        journal._file = open(filename, "a", encoding="utf-8")
+        # new records must not be glued to a torn one
+        journal._file.truncate(end)
+        return journal
+
+    def _add_record(self, record: Any) -> bool:
+        # False for anything but the records written above
+        if not isinstance(record, list) or not record:
+            return False
+        kind, *fields = record
+        if kind == "P":
+            if len(fields) != 2 or not all(isinstance(f, str) for f in fields):
+                return False
+            self.plan.append((fields[0], fields[1]))
+        elif kind in ("D", "U"):
+            # an index into the renames planned before it
+            if len(fields) != 1 or type(fields[0]) is not int:
+                return False
+            if not 0 <= fields[0] < len(self.plan):
+                return False
+            (self.done if kind == "D" else self.undone).add(fields[0])
+        elif kind != "B" or fields:
+            return False
+        return True
+
+    def track(self, marker: str, sources: Dict[str, int]) -> None:
+        # record(path) appends [marker, sources[path]]
+        self._marker = marker
+        self._sources = sources
+
+    def record(self, source: str) -> None:
+        index = self._sources[source]
+        with self._lock:
+            self._write([self._marker, index])
+            (self.done if self._marker == "D" else self.undone).add(index)
+            self._unsynced += 1
+            if self._unsynced >= JOURNAL_SYNC_EVERY:
+                self._sync()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _write(self, record: List[Any]) -> None:
+        assert self._file is not None
+        self._file.write(self._dumps(record) + "\n")
+
+    def _sync(self) -> None:
+        assert self._file is not None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+
+class _RateLimiter:
+    def __init__(self, rate: float) -> None:
+        self._interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_renameat2() -> Optional[Callable[[int, bytes, int, bytes, int], int]]:
+    # renameat2 of glibc 2.28 and later, None where it is not available
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    renameat2.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    ]
+    renameat2.restype = ctypes.c_int
+    return renameat2
+
+
+# Open descriptors of the parent directories of the entries being renamed, so
+# that every rename resolves only the last component of its paths. With
+# renameat2 the rename fails instead of replacing an existing entry, leaving
+# no gap between checking the target and renaming onto it.
+class _DirFds:
+    RENAME_NOREPLACE = 1
+    supported = (
+        hasattr(os, "O_DIRECTORY")
+        and os.rename in os.supports_dir_fd
+        and os.stat in os.supports_dir_fd
+    )
+
+    def __init__(self) -> None:
+        import ctypes
+
+        self._fds: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self._renameat2 = _load_renameat2()
+        self._get_errno = ctypes.get_errno
+
+    def rename(self, f: str, new_f: str) -> bool:
+        # False if new_f already exists
+        src_dir, src = os.path.split(f)
+        dst_dir, dst = os.path.split(new_f)
+        src_fd = self._get(src_dir)
+        dst_fd = src_fd if dst_dir == src_dir else self._get(dst_dir)
+        if self._renameat2 is not None:
+            flags = self.RENAME_NOREPLACE
+            result = self._renameat2(
+                src_fd, os.fsencode(src), dst_fd, os.fsencode(dst), flags
+            )
+            if result == 0:
+                self._forget(f)
+                return True
+            error = self._get_errno()
+            if error == errno.EEXIST:
+                return False
+            if error not in (errno.EINVAL, errno.ENOSYS):
+                raise OSError(error, os.strerror(error), f, None, new_f)
+            # not supported by this file system, nor by the next ones
+            self._renameat2 = None
+        try:
+            os.stat(dst, dir_fd=dst_fd, follow_symlinks=False)
+        except FileNotFoundError:
+            pass
+        else:
+            return False
+        os.rename(src, dst, src_dir_fd=src_fd, dst_dir_fd=dst_fd)
+        self._forget(f)
+        return True
+
+    def close(self) -> None:
+        while self._fds:
+            os.close(self._fds.popitem()[1])
+
+    def _get(self, path: str) -> int:
+        path = path or os.curdir
+        fd = self._fds.get(path)
+        if fd is not None:
+            self._fds.move_to_end(path)
+            return fd
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        self._fds[path] = fd
+        if len(self._fds) > DIR_FD_CACHE_SIZE:
+            os.close(self._fds.popitem(last=False)[1])
+        return fd
+
+    def _forget(self, path: str) -> None:
+        # path was renamed, the descriptors of it and below are not found
+        # by their old paths anymore
+        prefix = path + os.sep
+        for old in [p for p in self._fds if p == path or p.startswith(prefix)]:
+            os.close(self._fds.pop(old))
+
+
+# What the scanner and the renamer ask of a file system, answered by the OS.
+# See setFileSystem and MemoryFileSystem.
+class FileSystem:
+    def scandir(self, path: str) -> ContextManager[Iterable[_FileSystemEntry]]:
+        return os.scandir(path)
+
+    def stat(self, path: str) -> Tuple[int, int, int]:
+        # what tells a directory has not changed, see _ScanIndex
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_ino, st.st_dev
+
+    def isdir(self, path: str) -> bool:
+        return os.path.isdir(path)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def lexists(self, path: str) -> bool:
+        return os.path.lexists(path)
+
+    def realpath(self, path: str) -> str:
+        return os.path.realpath(path)
+
+    def rename(self, f: str, new_f: str) -> None:
+        os.rename(f, new_f)
+
+    def open_dir_fds(self) -> Optional[_DirFds]:
+        # None renames through rename() instead
+        return _DirFds() if _DirFds.supported else None
+
+
+class _MemoryDir:
+    __slots__ = ("entries", "mtime_ns", "ino")
+
+    def __init__(self, ino: int) -> None:
+        # subdirectories, None for files
+        self.entries: Dict[str, Optional[_MemoryDir]] = {}
+        self.mtime_ns = time.time_ns()
+        self.ino = ino
+
+
+class _MemoryEntry:
+    __slots__ = ("name", "path", "_is_dir")
+
+    def __init__(self, name: str, path: str, is_dir: bool) -> None:
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+
+    def is_dir(self) -> bool:
+        return self._is_dir
+
+    def is_symlink(self) -> bool:
+        return False
+
+
+_FileSystemEntry = Union["os.DirEntry[str]", _MemoryEntry]
+
+
+# A file system held in memory, for tests and benchmarks that need more
+# entries than are worth creating on disk. There are no symlinks and paths
+# are resolved without looking at the disk. Every listing and every rename
+# sleeps for the given latency, e.g. listdir_latency=0.005 to mimic NFS.
+class MemoryFileSystem(FileSystem):
+    def __init__(
+        self,
+        paths: Iterable[str] = (),
+        listdir_latency: float = 0.0,
+        rename_latency: float = 0.0,
+    ) -> None:
+        self._inodes = itertools.count(1)
+        self._root = _MemoryDir(next(self._inodes))
+        self._lock = threading.Lock()
+        self._listdir_latency = listdir_latency
+        self._rename_latency = rename_latency
+        for path in paths:
+            self.add(path)
+
+    def add(self, path: str, is_dir: bool = False) -> None:
+        # missing parents are created as well
+        with self._lock:
+            *parents, name = self._split(path)
+            node = self._root
+            for part in parents:
+                child = node.entries.get(part)
+                if child is None:
+                    if part in node.entries:
+                        raise _os_error(errno.ENOTDIR, path)
+                    child = node.entries[part] = _MemoryDir(next(self._inodes))
+                    node.mtime_ns = time.time_ns()
+                node = child
+            if name not in node.entries:
+                node.entries[name] = _MemoryDir(next(self._inodes)) if is_dir else None
+                node.mtime_ns = time.time_ns()
+
+    def paths(self, path: str = os.sep) -> Iterator[str]:
+        # everything below path, parents first
+        node = self._get_dir(self._split(path), path)
+        for name, child in list(node.entries.items()):
+            child_path = os.path.join(path, name)
+            yield child_path
+            if child is not None:
+                yield from self.paths(child_path)
+
+    def scandir(self, path: str) -> ContextManager[Iterable[_FileSystemEntry]]:
+        if self._listdir_latency:
+            time.sleep(self._listdir_latency)
+        node = self._get_dir(self._split(path), path)
+        join = os.path.join
+        entries = [
+            _MemoryEntry(name, join(path, name), child is not None)
+            for name, child in list(node.entries.items())
+        ]
+        return contextlib.nullcontext(entries)
+
+    def stat(self, path: str) -> Tuple[int, int, int]:
+        node = self._get_dir(self._split(path), path)
+        return node.mtime_ns, node.ino, 0
+
+    def isdir(self, path: str) -> bool:
+        try:
+            return self._get(path) is not None
+        except OSError:
+            return False
+
+    def exists(self, path: str) -> bool:
+        try:
+            self._get(path)
+        except OSError:
+            return False
+        return True
+
+    def lexists(self, path: str) -> bool:
+        return self.exists(path)
+
+    def realpath(self, path: str) -> str:
+        return os.path.abspath(path)
+
+    def rename(self, f: str, new_f: str) -> None:
+        if self._rename_latency:
+            time.sleep(self._rename_latency)
+        with self._lock:
+            *src_parents, src = self._split(f)
+            *dst_parents, dst = self._split(new_f)
+            src_dir = self._get_dir(src_parents, f)
+            dst_dir = self._get_dir(dst_parents, new_f)
+            if src not in src_dir.entries:
+                raise _os_error(errno.ENOENT, f)
+            node = src_dir.entries[src]
+            inside = dst_parents[: len(src_parents) + 1] == src_parents + [src]
+            if node is not None and inside:
+                raise _os_error(errno.EINVAL, new_f)
+            if dst in dst_dir.entries:
+                # replaced like os.rename does on POSIX
+                target = dst_dir.entries[dst]
+                if (node is None) != (target is None):
+                    raise _os_error(errno.EISDIR if node is None else errno.ENOTDIR, f)
+                if target is not None and target.entries and target is not node:
+                    raise _os_error(errno.ENOTEMPTY, new_f)
+            del src_dir.entries[src]
+            dst_dir.entries[dst] = node
+            src_dir.mtime_ns = dst_dir.mtime_ns = time.time_ns()
+
+    def open_dir_fds(self) -> Optional[_DirFds]:
+        return None
+
+    @staticmethod
+    def _split(path: str) -> listStr:
+        return [part for part in os.path.abspath(path).split(os.sep) if part]
+
+    def _get(self, path: str) -> Optional[_MemoryDir]:
+        # the directory at path, None for a file
+        parts = self._split(path)
+        if not parts:
+            return self._root
+        node = self._get_dir(parts[:-1], path)
+        if parts[-1] not in node.entries:
+            raise _os_error(errno.ENOENT, path)
+        return node.entries[parts[-1]]
+
+    def _get_dir(self, parts: listStr, path: str) -> _MemoryDir:
+        node = self._root
+        for part in parts:
+            child = node.entries.get(part)
+            if child is None:
+                error = errno.ENOTDIR if part in node.entries else errno.ENOENT
+                raise _os_error(error, path)
+            node = child
+        return node
+
+
+def _os_error(error: int, path: str) -> OSError:
+    # the OSError subclass os functions raise for that errno
+    return OSError(error, os.strerror(error), path)
+
+
+# targets that name the directory itself or its parent, always taken
+_RESERVED_NAMES = frozenset(("", os.curdir, os.pardir))
+
+
+def _estimate(samples: List[float]) -> Estimate:
+    # mean of independent estimates with its normal confidence interval
+    import math
+
+    n = len(samples)
+    mean = math.fsum(samples) / n
+    if n < 2:
+        return Estimate(mean, 0.0, math.inf)
+    variance = math.fsum((x - mean) ** 2 for x in samples) / (n - 1)
+    margin = SURVEY_Z * math.sqrt(variance / n)
+    return Estimate(mean, max(0.0, mean - margin), mean + margin)
+
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    # zipfile writes the zip64 record again when it is needed
+    records = []
+    i = 0
+    while i + 4 <= len(extra):
+        header_id, size = struct.unpack("<HH", extra[i : i + 4])
+        if header_id != 1:
+            records.append(extra[i : i + 4 + size])
+        i += 4 + size
+    return b"".join(records)
+
+
+def _copy_bytes(source: BinaryIO, target: BinaryIO, size: int) -> None:
+    while size > 0:
+        chunk = source.read(min(size, ARCHIVE_BUFFER_SIZE))
+        if not chunk:
+            raise EOFError("Archive member is truncated.")
+        target.write(chunk)
+        size -= len(chunk)
+
+
+def _tar_compression(filename: str) -> str:
+    # how tarfile should compress a new archive named filename
+    name = filename.lower()
+    for suffixes, compression in (
+        ((".gz", ".tgz"), "gz"),
+        ((".bz2", ".tbz", ".tbz2"), "bz2"),
+        ((".xz", ".txz"), "xz"),
+    ):
+        if name.endswith(suffixes):
+            return compression
+    return ""
+
+
+def _import_py7zr() -> Any:
+    try:
+        import py7zr
+    except ImportError:
+        raise ValueError("7z archives need py7zr.") from None
+    return py7zr
+
+
+def _read_7z(archive: Any, sizes: Dict[str, int]) -> Dict[str, IO[bytes]]:
+    # the content of every file of the archive, in memory or in a temporary
+    # file depending on its size
+    import io
+    import tempfile
+
+    try:
+        from py7zr.io import Py7zIO, WriterFactory
+    except ImportError:
+        # py7zr before 1.0 reads everything in memory
+        return dict(archive.readall() or {})
+
+    contents: Dict[str, IO[bytes]] = {}
+
+    class Writer(Py7zIO):
+        def __init__(self, file: IO[bytes]) -> None:
+            self._file = file
+
+        def write(self, s: Union[bytes, bytearray]) -> int:
+            return self._file.write(s)
+
+        def read(self, size: Optional[int] = None) -> bytes:
+            return self._file.read(-1 if size is None else size)
+
+        def seek(self, offset: int, whence: int = 0) -> int:
+            return self._file.seek(offset, whence)
+
+        def flush(self) -> None:
+            self._file.flush()
+
+        def size(self) -> int:
+            position = self._file.tell()
+            end = self._file.seek(0, os.SEEK_END)
+            self._file.seek(position)
+            return end
+
+    class Factory(WriterFactory):
+        def create(self, filename: str) -> Py7zIO:
+            if sizes.get(filename, 0) > ARCHIVE_SPOOL_SIZE:
+                file: IO[bytes] = tempfile.TemporaryFile()
+            else:
+                file = io.BytesIO()
+            contents[filename] = file
+            return Writer(file)
+
+    archive.extract(factory=Factory())
+    return contents
+
+
+class _BatchedProgress:
+    def __init__(self, callback: Optional[RenameCallback]) -> None:
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._latest = ""
+        self._last_report = time.monotonic()
+
+    def advance(self, f: str) -> None:
+        if self._callback is None:
+            return
+        with self._lock:
+            self._pending += 1
+            self._latest = f
+            if self._pending < PROGRESS_BATCH_SIZE:
+                now = time.monotonic()
+                if now - self._last_report < PROGRESS_BATCH_INTERVAL:
+                    return
+            self._report()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._pending:
+                self._report()
+
+    def _report(self) -> None:
+        assert self._callback is not None
+        self._callback(self._pending, self._latest)
+        self._pending = 0
+        self._last_report = time.monotonic()
+
+
+# Durations of one kind of operation. Percentiles come from a uniform random
+# sample of at most STATS_RESERVOIR_SIZE of them (reservoir sampling).
+class _Timer:
+    def __init__(self, seed: int) -> None:
+        import random
+
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: List[float] = []
+        self._random = random.Random(seed).random
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            if len(self._samples) < STATS_RESERVOIR_SIZE:
+                self._samples.append(seconds)
+            else:
+                i = int(self._random() * self.count)
+                if i < STATS_RESERVOIR_SIZE:
+                    self._samples[i] = seconds
+
+    def report(self) -> Dict[str, float]:
+        import math
+
+        with self._lock:
+            samples = sorted(self._samples)
+
+        def percentile(p: float) -> float:
+            # nearest rank
+            if not samples:
+                return 0.0
+            return samples[max(0, math.ceil(p * len(samples)) - 1)] * 1000
+
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": self.max * 1000,
+        }
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self._counters: Dict[str, int] = {}
+        self._timers: Dict[str, _Timer] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def timer(self, name: str) -> _Timer:
+        timer = self._timers.get(name)
+        if timer is None:
+            with self._lock:
+                timer = self._timers.setdefault(name, _Timer(len(self._timers)))
+        return timer
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            timers = dict(self._timers)
+        return {
+            "elapsed_s": time.perf_counter() - self._start,
+            "counters": counters,
+            "timers": {name: timers[name].report() for name in sorted(timers)},
+        }
+
+
+# Both watchers tell which directories changed, not what changed in them: the
+# changed directories are listed again, which also finds new subdirectories
+class _InotifyWatcher:
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    _mask = IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+
+    def __init__(self) -> None:
+        import ctypes
+
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths: Dict[int, str] = {}
+        self._wds: Dict[str, int] = {}
+
+    def known(self, path: str) -> bool:
+        return path in self._wds
+
+    def add(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._mask)
+        if wd < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error), path)
+        # watching a directory again returns its old descriptor, which means it
+        # was moved and everything below it moved along
+        old_path = self._paths.get(wd)
+        if old_path is not None and old_path != path:
+            self._moved(old_path, path)
+        self._paths[wd] = path
+        self._wds[path] = wd
+
+    def discard(self, path: str) -> None:
+        wd = self._wds.pop(path, None)
+        if wd is not None:
+            del self._paths[wd]
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def read(self, timeout: float) -> Set[str]:
+        import select
+
+        dirty: Set[str] = set()
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return dirty
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return dirty
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+                offset += 16 + length
+                if mask & self.IN_Q_OVERFLOW:
+                    # events were lost, everything has to be checked
+                    dirty.update(self._wds)
+                elif mask & self.IN_IGNORED:
+                    path = self._paths.pop(wd, None)
+                    if path is not None and self._wds.get(path) == wd:
+                        del self._wds[path]
+                elif wd in self._paths:
+                    dirty.add(self._paths[wd])
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+    def _moved(self, old_path: str, new_path: str) -> None:
+        prefix = old_path + os.sep
+        for wd, path in list(self._paths.items()):
+            if path == old_path or path.startswith(prefix):
+                moved_path = new_path + path[len(old_path) :]
+                self._paths[wd] = moved_path
+                if self._wds.get(path) == wd:
+                    del self._wds[path]
+                self._wds[moved_path] = wd
+
+
+class _PollingWatcher:
+    def __init__(self) -> None:
+        self._mtimes: Dict[str, int] = {}
+
+    def known(self, path: str) -> bool:
+        return path in self._mtimes
+
+    def add(self, path: str) -> None:
+        try:
+            self._mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+
+    def discard(self, path: str) -> None:
+        self._mtimes.pop(path, None)
+
+    def read(self, timeout: float) -> Set[str]:
+        time.sleep(timeout)
+        changed: Dict[str, Optional[int]] = {}
+        stat = os.stat
+        for path, mtime in self._mtimes.items():
+            try:
+                new_mtime = stat(path).st_mtime_ns
+            except OSError:
+                # gone, reported once
+                changed[path] = None
+                continue
+            if new_mtime != mtime:
+                changed[path] = new_mtime
+        for path, changed_mtime in changed.items():
+            if changed_mtime is None:
+                del self._mtimes[path]
+            else:
+                self._mtimes[path] = changed_mtime
+        return set(changed)
+
+    def close(self) -> None:
+        self._mtimes = {}
+
+
+_Watcher = Union[_InotifyWatcher, _PollingWatcher]
+
+
+# A rule file is a JSON object with any of these keys:
+#   "fold": true folds every character to its NFKD decomposition without the
+#           combining marks ("é" -> "e", "ﬁ" -> "fi", "Ｂ" -> "B")
+#   "keep": code point ranges left untouched by "fold", e.g. "U+4E00..U+9FFF"
+#           to pass CJK through
+#   "map": characters converted by -u, over the folded and built-in ones
+#   "special": characters converted by -s, over the built-in ones
+# The result is loaded once per process and shared by every cesp object.
+def load_rules(filename: str) -> TransliterationRules:
+    st = os.stat(filename)
+    return _load_rules(os.path.realpath(filename), st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_rules(filename: str, mtime_ns: int, size: int) -> TransliterationRules:
+    import json
+
+    cesp_logger.debug('Loading rules from "{}"'.format(filename))
+    with open(filename, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    rule_keys = {"fold", "keep", "map", "special"}
+    if not isinstance(rules, dict) or not set(rules) <= rule_keys:
+        raise ValueError("Invalid rule file.")
+
+    utf_chars = dict(cesp._utf_chars)
+    if rules.get("fold", False):
+        keep = [_parse_code_range(r) for r in rules.get("keep", [])]
+        for char, folded in _fold_table().items():
+            code = ord(char)
+            if not any(first <= code <= last for first, last in keep):
+                utf_chars[char] = folded
+    utf_chars.update(_check_rule_map(rules.get("map", {})))
+    special_chars = dict(cesp._special_chars)
+    special_chars.update(_check_rule_map(rules.get("special", {})))
+    return TransliterationRules(
+        MappingProxyType(utf_chars), MappingProxyType(special_chars), filename
+    )
+
+
+def _parse_code_range(code_range: str) -> Tuple[int, int]:
+    # "U+4E00..U+9FFF" or a single "U+00DF"
+    try:
+        first, _, last = code_range.upper().partition("..")
+        if not first.startswith("U+") or (last and not last.startswith("U+")):
+            raise ValueError
+        return int(first[2:], 16), int((last or first)[2:], 16)
+    except (AttributeError, ValueError):
+        raise ValueError("Invalid code point range: {!r}.".format(code_range))
+
+
+def _check_rule_map(rule_map: Any) -> Dict[str, str]:
+    if not isinstance(rule_map, dict) or not all(
+        len(k) == 1 and isinstance(v, str) for k, v in rule_map.items()
+    ):
+        raise ValueError("Rule maps must map single characters to strings.")
+    return rule_map
+
+
+@functools.lru_cache(maxsize=None)
+def _fold_table() -> Mapping[str, str]:
+    # Building it goes through every code point, which takes a good part of a
+    # second, so it is cached on disk for each Unicode version
+    import json
+    import unicodedata
+
+    key = [__version__, unicodedata.unidata_version]
+    cache_file = os.path.join(
+        _cache_dir(), "fold-{}.json".format(unicodedata.unidata_version)
+    )
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["key"] == key:
+            return MappingProxyType(cached["table"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    table = _compute_fold_table()
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "table": table}, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        cesp_logger.debug("Could not cache fold table: {}".format(e))
+    return MappingProxyType(table)
+
+
+def _compute_fold_table() -> Dict[str, str]:
+    import unicodedata
+
+    decomposition = unicodedata.decomposition
+    combining = unicodedata.combining
+    normalize = unicodedata.normalize
+    table = {}
+    for code in range(0x80, sys.maxunicode + 1):
+        char = chr(code)
+        if not decomposition(char) and not combining(char):
+            continue
+        folded = "".join(c for c in normalize("NFKD", char) if not combining(c))
+        # spacing accents ("´" -> " ́") are left to the special characters
+        if folded != char and not folded.startswith(" "):
+            table[char] = folded
+    return table
+
+
+def _cache_dir() -> str:
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+    return os.path.join(base, "cesp")
+
+
+def _with_upper(chars: Dict[str, str]) -> Mapping[str, str]:
+    upper = {k.upper(): v.upper() for k, v in chars.items()}
+    return MappingProxyType({**chars, **upper})
+
+
 class cesp:
-    _special_chars = {
-        "?": "_",
-        "$": "_",
-        "%": "_",
-        "°": "o",
-        "!": "_",
-        "@": "_",
-        '"': "_",
-        "´": "",
-        "'": "",
-        "¨": "_",
-        "#": "_",
-        "|": "_",
-        "<": "_",
-        ">": "_",
-        "/": "_",
-        "§": "_",
-        "\\": "_",
-        "&": "_and_",
-        "*": "_",
-        ":": "_",
-        ";": "_",
-        ",": "_",
-        "+": "_",
-        "=": "_",
-        "~": "",
-        "^": "",
-        "ª": "a",
-        "º": "o",
-        "°": "o",
-    }
+    # shared by every object, setRuleFile replaces them for one object only
+    _special_chars: Mapping[str, str] = MappingProxyType(
+        {
+            "?": "_",
+            "$": "_",
+            "%": "_",
+            "°": "o",
+            "!": "_",
+            "@": "_",
+            '"': "_",
+            "´": "",
+            "'": "",
+            "¨": "_",
+            "#": "_",
+            "|": "_",
+            "<": "_",
+            ">": "_",
+            "/": "_",
+            "§": "_",
+            "\\": "_",
+            "&": "_and_",
+            "*": "_",
+            ":": "_",
+            ";": "_",
+            ",": "_",
+            "+": "_",
+            "=": "_",
+            "~": "",
+            "^": "",
+            "ª": "a",
+            "º": "o",
+            "°": "o",
+        }
+    )
 
-    _utf_chars = {
-        "ç": "c",
-        "ä": "a",
-        "ã": "a",
-        "â": "a",
-        "á": "a",
-        "à": "a",
-        "é": "e",
-        "ê": "e",
-        "è": "e",
-        "í": "i",
-        "î": "i",
-        "ì": "i",
-        "ó": "o",
-        "ô": "o",
-        "ò": "o",
-        "õ": "o",
-        "ú": "u",
-        "ü": "u",
-        "û": "u",
-        "ù": "u",
-    }
+    _utf_chars = _with_upper(
+        {
+            "ç": "c",
+            "ä": "a",
+            "ã": "a",
+            "â": "a",
+            "á": "a",
+            "à": "a",
+            "é": "e",
+            "ê": "e",
+            "è": "e",
+            "í": "i",
+            "î": "i",
+            "ì": "i",
+            "ó": "o",
+            "ô": "o",
+            "ò": "o",
+            "õ": "o",
+            "ú": "u",
+            "ü": "u",
+            "û": "u",
+            "ù": "u",
+        }
+    )
 
     def __init__(self) -> None:
         self.logger = logging.getLogger("cesp")
         self.logger.debug("Constructing object")
+        self._fs = FileSystem()
         self._path = os.path.realpath(os.getcwd())
         self._recursive = False
+        self._jobs = 1
+        self._rename_rate = 0.0
+        # as given to setIgnoredDirs, resolved against the path by setPath
+        self._ignored_dirs_input: listStr = []
         self._ignored_dirs: listStr = []
         self._ignored_exts: listStr = []
+        self._ignored_dirs_set: FrozenSet[str] = frozenset()
+        self._ignored_exts_set: FrozenSet[str] = frozenset()
         self._convert_utf = False
         self._convert_dots = False
         self._convert_brackets = False
@@ -106,73 +1427,168 @@ class cesp:
         self._quiet = False
         self._no_change = True
         self._change: ChangeItemMode = ChangeItemMode.files
+        self._on_collision: CollisionPolicy = CollisionPolicy.skip
+        self._collisions: List[Collision] = []
+        self._scanned = 0
+        self._low_memory = False
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._processes = 1
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        # the converter the process pool was started with
+        self._process_pool_converter: Optional[CompiledConverter] = None
+        self._converter: Optional[CompiledConverter] = None
+        self._rule_file: Optional[str] = None
+        # None unless setStats(True), every hot path checks it first
+        self._stats: Optional[_Stats] = None
+        self._name_cache_size = NAME_CACHE_SIZE
+        self._index_file: Optional[str] = None
+        self._index: Optional[_ScanIndex] = None
+        self._journal_file: Optional[str] = None
+        # while watching, every pass adds its renames to the same journal
+        self._watch_journal: Optional[_RenameJournal] = None
+        self._watch_backend: WatchBackend = WatchBackend.auto
+        self._watch_debounce = WATCH_DEBOUNCE
 
         self._print: Callable[[Any], None] = lambda x: None
         self._update_print()
         self.original_path = os.getcwd()
 
-        self._append_upper_to_dict(self._utf_chars)
-
     # Commands
 
     def fetch(
         self, callback: Optional[Callable[[str, int], None]] = None
     ) -> Tuple[listStr, listStr]:
         self.logger.debug('"fetch" called')
+        start = time.perf_counter()
         original_files = []
         renamed_files = []
 
-        if not os.path.isdir(self._path):
-            raise ValueError("Invalid path.")
-
-        self.logger.debug('Original path "{}"'.format(self.original_path))
-        self.logger.debug('Changing path to "{}"'.format(self._path))
-        os.chdir(self._path)
+        self._check_path()
+        self._open_index()
+        self._collisions = []
+        self._scanned = 0
 
         self.logger.debug("Walking directory tree and collecting names to be renamed")
+        callback = self._timed("progress", callback)
         total = 0
-        for root, dirs, files in os.walk(".", topdown=True):
-            files = [
-                f
-                for f in files
-                if not f.startswith(".") and self._isPathGood(os.path.join(root, f))
-            ]
-            dirs = [
-                d
-                for d in dirs
-                if not d.startswith(".") and self._isPathGood(os.path.join(root, d))
-            ]
-            if self._change == ChangeItemMode.files:
-                wd = files
-            elif self._change == ChangeItemMode.dirs:
-                wd = dirs
-            else:
-                wd = files + dirs
-            for f in wd:
-                new_f = self._get_converted_name(f)
-                if f != new_f:
-                    original_files.append(os.path.join(root, f))
-                    renamed_files.append(os.path.join(root, new_f))
+        try:
+            scans = self._convert_in_processes(self._walk(topdown=True))
+            for scan, converted in scans:
+                for entry in self._convert_scan(scan, converted):
+                    original_files.append(entry.original)
+                    renamed_files.append(entry.target)
                     total += 1
                     if callback is not None:
-                        callback(f, total)
-
-            if not self._recursive:
-                break
+                        callback(os.path.basename(entry.original), total)
+        finally:
+            self._close_index()
+        self._log_cache_stats()
+        self._check_collisions()
 
         self.logger.debug("Collected {} files to be renamed".format(len(renamed_files)))
+        if self._stats is not None:
+            self._stats.timer("fetch").add(time.perf_counter() - start)
 
         return list(reversed(original_files)), list(reversed(renamed_files))
 
-    def return_to_original_path(self) -> None:
-        self.logger.debug('Returning to path "{}"'.format(self.original_path))
-        os.chdir(self.original_path)
-
-    def rename_item(self, f: str, new_f: str, print_rename: bool = True) -> None:
-        if os.path.exists(new_f):
+    def iter_fetch(
+        self, callback: Optional[Callable[[str, int], None]] = None
+    ) -> Generator[Tuple[str, str], None, None]:
+        # Lazy version of fetch: the tree is walked in post-order, so the
+        # contents of a directory are always yielded before the directory itself
+        self.logger.debug('"iter_fetch" called')
+        callback = self._timed("progress", callback)
+        total = 0
+        for entry in self.plan():
+            total += 1
+            if callback is not None:
+                callback(os.path.basename(entry.original), total)
+            yield entry.original, entry.target
+
+    def plan(self) -> Generator[PlanEntry, None, None]:
+        # Same walk as iter_fetch, but with the kind of each entry and why it
+        # got its new name. Nothing is printed.
+        return self._plan()
+
+    def _plan(
+        self, stop: Optional[threading.Event] = None
+    ) -> Generator[PlanEntry, None, None]:
+        # the walk ends early once stop is set, see _walk
+        self._check_path()
+        self._open_index()
+        self._collisions = []
+        self._scanned = 0
+
+        total = 0
+        try:
+            scans = self._convert_in_processes(self._walk(False, stop))
+            for scan, converted in scans:
+                entries = self._convert_scan(scan, converted)
+                self._check_collisions()
+                total += len(entries)
+                yield from entries
+        finally:
+            self._close_index()
+        self._log_cache_stats()
+
+        self.logger.debug("Planned {} renames".format(total))
+
+    def apply(self, entries: Iterable[PlanEntry]) -> Iterator[RenameResult]:
+        # Renames the entries in the given order and yields the outcome of each
+        # one. Errors are reported in the results instead of being raised and
+        # nothing is printed.
+        limiter = _RateLimiter(self._rename_rate) if self._rename_rate > 0 else None
+        fds = self._open_dir_fds()
+        try:
+            for entry in entries:
+                if limiter is not None:
+                    limiter.wait()
+                if self._no_change:
+                    if self._exists(entry.target):
+                        yield RenameResult(entry, RenameStatus.exists)
+                    else:
+                        yield RenameResult(entry, RenameStatus.no_change)
+                    continue
+                try:
+                    renamed = self._rename_new(entry.original, entry.target, fds)
+                except OSError as e:
+                    yield RenameResult(entry, RenameStatus.failed, e)
+                else:
+                    status = RenameStatus.renamed if renamed else RenameStatus.exists
+                    yield RenameResult(entry, status)
+        finally:
+            if fds is not None:
+                fds.close()
+
+    def return_to_original_path(self) -> None:
+        self.logger.debug('Returning to path "{}"'.format(self.original_path))
+        os.chdir(self.original_path)
+
+    def rename_item(self, f: str, new_f: str, print_rename: bool = True) -> bool:
+        return self._rename_item(f, new_f, print_rename)
+
+    def _rename_item(
+        self,
+        f: str,
+        new_f: str,
+        print_rename: bool = True,
+        fds: Optional[_DirFds] = None,
+    ) -> bool:
+        if self._no_change:
+            renamed = not self._exists(new_f)
+        else:
+            try:
+                renamed = self._rename_new(f, new_f, fds)
+            except OSError as e:
+                # one failed rename does not stop the others
+                self.logger.debug('Could not rename "{}": {}'.format(f, e))
+                self._print(f"[bold red]Could not rename[/] {f}: {e.strerror}")
+                return False
+        if not renamed:
             self._print(f"[bold]{new_f}[/] already exists")
+            return False
         else:
-            if print_rename:
+            if print_rename and not self._quiet:
                 base_new_f = os.path.basename(new_f)
                 base_old_f = os.path.basename(f)
                 sep = r"\\"
@@ -181,184 +1597,2100 @@ class cesp:
                 )
                 fmt_new_f = f"[dim]{os.path.dirname(new_f)}{sep}[/dim][bold green]{base_new_f}[/]"
                 self._print(f"{fmt_old_f} -> {fmt_new_f}")
+            return True
+
+    def rename_list(
+        self,
+        original_files: listStr,
+        renamed_files: listStr,
+        callback: Optional[RenameCallback] = None,
+    ) -> int:
+
+        self.logger.debug("Renaming files")
+        start = time.perf_counter()
+        pairs = list(zip(original_files, renamed_files))
+
+        journal = self._create_journal(pairs)
+        try:
+            self._rename_pairs(pairs, callback, journal)
+        finally:
+            if journal is not None and journal is not self._watch_journal:
+                journal.close()
+
+        if not self._no_change:
+            self.logger.debug("Renamed {} files".format(len(renamed_files)))
+        if self._stats is not None:
+            self._stats.timer("rename_list").add(time.perf_counter() - start)
+
+        self.logger.debug("rename_list method finished")
+        return 0
+
+    async def afetch(
+        self, max_pending: int = 16, executor: Optional[Executor] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        # iter_fetch for asyncio: the walk runs on the executor and hands the
+        # pairs over in batches through a queue of at most max_pending
+        # batches, so a slow consumer pauses the walk
+        import asyncio
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=max_pending)
+        stop = threading.Event()
+
+        def put(item: Any) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except FutureTimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+
+        def produce() -> None:
+            try:
+                with contextlib.closing(self._plan(stop)) as entries:
+                    batch = []
+                    for entry in entries:
+                        batch.append((entry.original, entry.target))
+                        if len(batch) >= ASYNC_BATCH_SIZE:
+                            if not put(batch):
+                                return
+                            batch = []
+                    if batch and not put(batch):
+                        return
+                put(None)
+            except Exception as e:
+                put(e)
+
+        producer = loop.run_in_executor(executor, produce)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                for pair in batch:
+                    yield pair
+        finally:
+            stop.set()
+            await producer
+
+    async def arename_list(
+        self,
+        original_files: listStr,
+        renamed_files: listStr,
+        callback: Optional[RenameCallback] = None,
+        executor: Optional[Executor] = None,
+    ) -> int:
+        # rename_list for asyncio: the renames run on the executor in batches
+        # of ASYNC_BATCH_SIZE, keeping the same children-first ordering
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        pairs = list(zip(original_files, renamed_files))
+        progress = _BatchedProgress(self._timed("progress", callback))
+        limiter = _RateLimiter(self._rename_rate) if self._rename_rate > 0 else None
+
+        async def rename_batch(
+            batch: List[Tuple[str, str]], journal: Optional[_RenameJournal]
+        ) -> None:
+            for i in range(0, len(batch), ASYNC_BATCH_SIZE):
+                await loop.run_in_executor(
+                    executor,
+                    self._rename_batch,
+                    batch[i : i + ASYNC_BATCH_SIZE],
+                    limiter,
+                    progress,
+                    journal,
+                )
+
+        journal = self._create_journal(pairs)
+        try:
+            if self._jobs > 1:
+                for level in self._rename_levels(pairs):
+                    await asyncio.gather(*(rename_batch(b, journal) for b in level))
+            else:
+                await rename_batch(pairs, journal)
+        finally:
+            if journal is not None:
+                journal.close()
+        progress.flush()
+        return 0
+
+    def rename_iter(
+        self,
+        pairs: Iterable[Tuple[str, str]],
+        callback: Optional[RenameCallback] = None,
+    ) -> int:
+        # Streaming version of rename_list: the pairs are renamed one by one as
+        # they come, so they must already be in a safe (children first) order
+        self.logger.debug("Renaming files from iterator")
+        progress = _BatchedProgress(self._timed("progress", callback))
+        limiter = _RateLimiter(self._rename_rate) if self._rename_rate > 0 else None
+        total = self._rename_streamed(iter(pairs), limiter, progress)
+        progress.flush()
+        self.logger.debug("rename_iter processed {} files".format(total))
+        return total
+
+    def rename_tree(self, callback: Optional[RenameCallback] = None) -> int:
+        # fetch and rename in a single post-order walk: the entries of every
+        # directory are renamed as soon as its subtree is done. With
+        # setLowMemory(True) only the listings of the directories between the
+        # path and the current one are held, not the whole tree.
+        self.logger.debug('"rename_tree" called')
+        start = time.perf_counter()
+        progress = _BatchedProgress(self._timed("progress", callback))
+        limiter = _RateLimiter(self._rename_rate) if self._rename_rate > 0 else None
+        total = self._rename_streamed(self.iter_fetch(), limiter, progress)
+        progress.flush()
+
+        self.logger.debug("rename_tree processed {} files".format(total))
+        if self._stats is not None:
+            self._stats.timer("rename_tree").add(time.perf_counter() - start)
+        return total
+
+    def resume_journal(
+        self, filename: str, callback: Optional[RenameCallback] = None
+    ) -> int:
+        self.logger.debug('Resuming journal "{}"'.format(filename))
+        journal = _RenameJournal.load(filename)
+        try:
+            pairs = []
+            landed = []
+            sources = {}
+            for i, (f, new_f) in enumerate(journal.plan):
+                if i in journal.done:
+                    continue
+                sources[f] = i
+                if not self._fs.lexists(f) and self._fs.lexists(new_f):
+                    # renamed right before the interruption, but not synced
+                    landed.append(f)
+                else:
+                    pairs.append((f, new_f))
+            journal.track("D", sources)
             if not self._no_change:
-                os.rename(f, new_f)
+                for f in landed:
+                    journal.record(f)
+            self.logger.debug(
+                "{} of {} renames left".format(len(pairs), len(journal.plan))
+            )
+            self._rename_pairs(pairs, callback, None if self._no_change else journal)
+        finally:
+            journal.close()
+        return len(pairs)
+
+    def undo_journal(
+        self, filename: str, callback: Optional[RenameCallback] = None
+    ) -> int:
+        # Renames are reverted in the opposite order they were planned, which
+        # means parents before their children
+        self.logger.debug('Undoing journal "{}"'.format(filename))
+        journal = _RenameJournal.load(filename)
+        try:
+            indexes = sorted(journal.done - journal.undone, reverse=True)
+            pairs = [(journal.plan[i][1], journal.plan[i][0]) for i in indexes]
+            journal.track("U", {new_f: i for i, (new_f, _) in zip(indexes, pairs)})
+            progress = _BatchedProgress(self._timed("progress", callback))
+            limiter = _RateLimiter(self._rename_rate) if self._rename_rate > 0 else None
+            self._rename_batch(
+                pairs, limiter, progress, None if self._no_change else journal
+            )
+            progress.flush()
+        finally:
+            journal.close()
+        return len(pairs)
+
+    def read_paths(self, stream: BinaryIO, separator: bytes = b"\n") -> Iterator[str]:
+        # the paths of a listing such as find -print0 (separator b"\0"), read
+        # in chunks of STDIN_CHUNK_SIZE. Empty paths are skipped.
+        self.logger.debug("Reading paths separated by {!r}".format(separator))
+        str_separator = os.fsdecode(separator)
+        rest = b""
+        while True:
+            chunk = stream.read(STDIN_CHUNK_SIZE)
+            if not chunk:
+                break
+            # the complete paths of the chunk are decoded all at once
+            complete, found, rest = (rest + chunk).rpartition(separator)
+            if found:
+                for path in os.fsdecode(complete).split(str_separator):
+                    if path:
+                        yield path
+        if rest:
+            yield os.fsdecode(rest)
+
+    def convert_paths(self, paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        # (path, renamed path) for every given path whose name changes, without
+        # walking anything. The pairs keep the given order, so they can be
+        # renamed as they come only if children are listed before their
+        # parents (find -depth).
+        self.logger.debug('"convert_paths" called')
+        self._collisions = []
+        convert = self._get_converter().convert
+        stats = self._stats
+        sep, altsep = os.sep, os.altsep
+        seps = sep + (altsep or "")
+        for path in paths:
+            if stats is not None:
+                stats.count("entries_seen")
+            path = path.rstrip(seps) or path
+            # cheaper than os.path.split, and the parent is kept as given
+            cut = path.rfind(sep)
+            if altsep is not None:
+                cut = max(cut, path.rfind(altsep))
+            cut += 1
+            name = path[cut:]
+            if not name or name.startswith("."):
+                continue
+            new_name = convert(name)
+            if new_name == name:
+                continue
+            if self._ignored_exts_set and not self._isExtensionGood(name):
+                continue
+            if self._ignored_dirs_set and not self._isDirGood(
+                os.path.join(self._fs.realpath(path[:cut]), name), resolve=False
+            ):
+                continue
+            if self._change != ChangeItemMode.all:
+                if self._fs.isdir(path) != (self._change == ChangeItemMode.dirs):
+                    continue
+            if new_name in _RESERVED_NAMES:
+                # the other names of the directory are not known here, so
+                # only these collisions are found before renaming
+                target = path[:cut] + new_name
+                if self._on_collision != CollisionPolicy.suffix:
+                    self._collisions.append(Collision(path, target, None))
+                    self._check_collisions()
+                    continue
+                new_name = "_1"
+                self._collisions.append(Collision(path, target, path[:cut] + new_name))
+            if stats is not None:
+                stats.count("renames_planned")
+            yield path, path[:cut] + new_name
+
+    def write_plan(self, filename: str, pairs: Iterable[Tuple[str, str]]) -> int:
+        # filename "-" is the standard output
+        import json
+
+        self.logger.debug('Writing rename plan to "{}"'.format(filename))
+        total = 0
+        if filename == "-":
+            output: ContextManager[TextIO] = contextlib.nullcontext(sys.stdout)
+        else:
+            output = open(filename, "w", encoding="utf-8")
+        # same lines as json.dumps, without its per call overhead
+        encode = json.encoder.encode_basestring_ascii
+        with output as plan:
+            plan.write(json.dumps(PLAN_HEADER) + "\n")
+            for f, new_f in pairs:
+                plan.write("[" + encode(f) + ", " + encode(new_f) + "]\n")
+                total += 1
+        self.logger.debug("Wrote {} entries".format(total))
+        return total
+
+    def read_plan(self, filename: str) -> Iterator[Tuple[str, str]]:
+        import json
+
+        self.logger.debug('Reading rename plan from "{}"'.format(filename))
+        with open(filename, "r", encoding="utf-8") as plan:
+            if json.loads(plan.readline() or "null") != PLAN_HEADER:
+                raise ValueError("Invalid plan file.")
+            for line in plan:
+                f, new_f = json.loads(line)
+                yield f, new_f
+
+    def watch(
+        self,
+        callback: Optional[Callable[[int], None]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> int:
+        # Renames everything once, then keeps renaming new entries as they show
+        # up until stop is set. callback is called with the number of renames
+        # of every pass that found something.
+        self.logger.debug('"watch" called')
+        if isinstance(self._fs, MemoryFileSystem):
+            raise ValueError("Only the real file system can be watched.")
+        self._check_path()
+        if stop is None:
+            stop = threading.Event()
+
+        watcher = self._create_watcher()
+        if self._journal_file is not None and not self._no_change:
+            self.logger.debug('Streaming journal to "{}"'.format(self._journal_file))
+            self._watch_journal = _RenameJournal.stream(self._journal_file)
+        try:
+            # the directories are watched before the first pass, so nothing
+            # created while it runs is missed
+            try:
+                self._watch_tree(watcher)
+            except OSError as e:
+                if self._watch_backend == WatchBackend.inotify or isinstance(
+                    watcher, _PollingWatcher
+                ):
+                    raise
+                self.logger.debug("inotify failed ({}), polling instead".format(e))
+                watcher.close()
+                watcher = _PollingWatcher()
+                self._watch_tree(watcher)
+
+            original_files, renamed_files = self.fetch()
+            self.rename_list(original_files, renamed_files)
+            total = len(original_files)
+            if total and callback is not None:
+                callback(total)
+
+            while not stop.is_set():
+                dirty = self._wait_for_changes(watcher, stop)
+                if not dirty:
+                    continue
+                renames = self._watch_pass(watcher, dirty)
+                total += renames
+                if renames and callback is not None:
+                    callback(renames)
+        finally:
+            watcher.close()
+            if self._watch_journal is not None:
+                self._watch_journal.close()
+                self._watch_journal = None
+        self.logger.debug("Stopped watching after {} renames".format(total))
+        return total
+
+    def batch(
+        self, roots: Iterable[str], callback: Optional[RenameCallback] = None
+    ) -> Iterator[RootReport]:
+        # fetch and rename_list for every root in turn, reusing the converter
+        # and the worker threads. A root that fails is reported and skipped.
+        original_path = self._path
+        try:
+            for root in roots:
+                start = time.perf_counter()
+                self.setPath(root)
+                self.logger.debug('Processing root "{}"'.format(self._path))
+                self._scanned = 0
+                try:
+                    if self._low_memory:
+                        renames = self.rename_tree(callback)
+                    else:
+                        original_files, renamed_files = self.fetch()
+                        self.rename_list(original_files, renamed_files, callback)
+                        renames = len(original_files)
+                except (OSError, ValueError) as e:
+                    elapsed = time.perf_counter() - start
+                    yield RootReport(self._path, self._scanned, 0, elapsed, e)
+                    continue
+                elapsed = time.perf_counter() - start
+                yield RootReport(self._path, self._scanned, renames, elapsed)
+        finally:
+            self.setPath(original_path)
+
+    def rename_archive(self, filename: str, output: str) -> List[Tuple[str, str]]:
+        # Writes a copy of the zip, tar or 7z archive filename to output with
+        # its members renamed like the entries of a directory tree, and
+        # returns the (member, renamed member) pairs. Zip members are copied
+        # without recompressing them and tar members are streamed across; 7z
+        # archives need py7zr. With setNoChange(True) nothing is written.
+        self.logger.debug('"rename_archive" called for "{}"'.format(filename))
+        if os.path.realpath(filename) == os.path.realpath(output):
+            raise ValueError("The renamed archive can not replace the original.")
+        with open(filename, "rb") as f:
+            magic = f.read(6)
+        if magic.startswith(b"PK\x03\x04") or magic.startswith(b"PK\x05\x06"):
+            kind = "zip"
+        elif magic == b"7z\xbc\xaf\x27\x1c":
+            kind = "7z"
+        else:
+            import tarfile
+
+            if not tarfile.is_tarfile(filename):
+                raise ValueError("Unsupported archive.")
+            kind = "tar"
+
+        self._collisions = []
+        self._scanned = 0
+        if kind == "zip":
+            members = self._zip_members(filename)
+        elif kind == "tar":
+            members = self._tar_members(filename)
+        else:
+            members = self._7z_members(filename)
+        rename = self._plan_archive(members)
+        self._check_collisions()
+        pairs = []
+        for name, _ in members:
+            new_name = rename(name)
+            if new_name != name:
+                pairs.append((name, new_name))
+        self.logger.debug(
+            "{} of {} archive members renamed".format(len(pairs), len(members))
+        )
+        if self._no_change:
+            return pairs
+
+        try:
+            if kind == "zip":
+                self._copy_zip(filename, output, rename)
+            elif kind == "tar":
+                self._copy_tar(filename, output, rename)
+            else:
+                self._copy_7z(filename, output, rename)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(output)
+            raise
+        return pairs
+
+    def survey(
+        self, probes: int = SURVEY_PROBES, seed: Optional[int] = None
+    ) -> SurveyReport:
+        # Estimates what fetch() would find without walking the whole tree.
+        # Every probe goes from the root down to a leaf through random
+        # subdirectories, and counts a directory as many times as there are
+        # directories like it at its depth (the product of the numbers of
+        # subdirectories above it). Each probe is an unbiased estimate of the
+        # tree and the intervals come from how much the probes disagree.
+        # Directories are listed once however many probes go through them, with
+        # setJobs() threads.
+        import random
+
+        self.logger.debug('"survey" called with {} probes'.format(probes))
+        if probes < 1:
+            raise ValueError("Number of probes must be at least 1.")
+        start = time.perf_counter()
+        rng = random.Random(seed)
+        rules = self._survey_rules()
+        # entries, renames and one column per rule
+        totals = [[0.0] * (2 + len(rules)) for _ in range(probes)]
+        dirs: List[List[float]] = []
+        tallies: Dict[str, Tuple[List[int], listStr]] = {}
+        paths = [self._path] * probes
+        weights = [1.0] * probes
+        active = list(range(probes))
+        while active:
+            missing = sorted({paths[i] for i in active} - tallies.keys())
+            if self._jobs > 1 and len(missing) > 1:
+                listed = self._get_pool().map(self._survey_dir, missing)
+            else:
+                listed = map(self._survey_dir, missing)
+            tallies.update(zip(missing, listed))
+
+            depth_dirs = [0.0] * probes
+            dirs.append(depth_dirs)
+            next_active = []
+            for i in active:
+                counts, subdirs = tallies[paths[i]]
+                weight = weights[i]
+                depth_dirs[i] = weight
+                probe_totals = totals[i]
+                for column, count in enumerate(counts):
+                    probe_totals[column] += weight * count
+                if self._recursive and subdirs:
+                    weights[i] = weight * len(subdirs)
+                    paths[i] = rng.choice(subdirs)
+                    next_active.append(i)
+            active = next_active
+
+        columns = [_estimate(list(column)) for column in zip(*totals)]
+        report = SurveyReport(
+            self._path,
+            probes,
+            len(tallies),
+            time.perf_counter() - start,
+            [_estimate(depth_dirs) for depth_dirs in dirs],
+            columns[0],
+            columns[1],
+            {name: columns[2 + i] for i, (name, _) in enumerate(rules)},
+        )
+        self.logger.debug(
+            "Surveyed {} directories in {:.2f} s".format(
+                report.dirs_listed, report.seconds
+            )
+        )
+        return report
+
+    def close(self) -> None:
+        # stops the worker threads, they are started again when needed
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._close_process_pool()
+
+    # helper Functions
+
+    def _exists(self, path: str) -> bool:
+        if self._stats is None:
+            return self._fs.exists(path)
+        start = time.perf_counter()
+        try:
+            return self._fs.exists(path)
+        finally:
+            self._stats.timer("stat").add(time.perf_counter() - start)
+
+    def _rename(self, f: str, new_f: str) -> None:
+        if self._stats is None:
+            self._fs.rename(f, new_f)
+            return
+        start = time.perf_counter()
+        try:
+            self._fs.rename(f, new_f)
+        except OSError:
+            self._stats.count("rename_errors")
+            raise
+        finally:
+            self._stats.timer("rename").add(time.perf_counter() - start)
+
+    def _open_dir_fds(self) -> Optional[_DirFds]:
+        # None renames by path: when nothing is renamed, or without dir_fd
+        if self._no_change:
+            return None
+        return self._fs.open_dir_fds()
+
+    def _rename_new(self, f: str, new_f: str, fds: Optional[_DirFds]) -> bool:
+        # renames f unless new_f already exists, False if it does
+        if os.path.basename(new_f) in ("", os.curdir, os.pardir):
+            # the directory itself or its parent, which always exist
+            return False
+        if fds is None:
+            if self._exists(new_f):
+                return False
+            self._rename(f, new_f)
+            return True
+        if self._stats is None:
+            return fds.rename(f, new_f)
+        start = time.perf_counter()
+        try:
+            return fds.rename(f, new_f)
+        except OSError:
+            self._stats.count("rename_errors")
+            raise
+        finally:
+            self._stats.timer("rename").add(time.perf_counter() - start)
+
+    def _timed(self, name: str, function: Optional[_F]) -> Optional[_F]:
+        # function itself, or a wrapper timing its calls when stats are on
+        stats = self._stats
+        if stats is None or function is None:
+            return function
+        timer = stats.timer(name)
+        call = function
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                timer.add(time.perf_counter() - start)
+
+        return timed  # type: ignore
+
+    def _create_journal(self, pairs: List[Tuple[str, str]]) -> Optional[_RenameJournal]:
+        if self._journal_file is None or self._no_change:
+            return None
+        if self._watch_journal is not None:
+            self._watch_journal.extend(pairs)
+            return self._watch_journal
+        self.logger.debug('Journaling renames to "{}"'.format(self._journal_file))
+        journal = _RenameJournal.create(self._journal_file, pairs)
+        journal.track("D", {f: i for i, (f, _) in enumerate(pairs)})
+        return journal
+
+    def _rename_streamed(
+        self,
+        pairs: Iterator[Tuple[str, str]],
+        limiter: Optional[_RateLimiter],
+        progress: _BatchedProgress,
+    ) -> int:
+        # with a journal, the pairs are planned JOURNAL_SYNC_EVERY at a time
+        # right before they are renamed
+        if self._journal_file is None or self._no_change:
+            return self._rename_batch(pairs, limiter, progress)
+        self.logger.debug('Streaming journal to "{}"'.format(self._journal_file))
+        journal = _RenameJournal.stream(self._journal_file)
+        total = 0
+        try:
+            while True:
+                chunk = list(itertools.islice(pairs, JOURNAL_SYNC_EVERY))
+                if not chunk:
+                    break
+                journal.extend(chunk)
+                total += self._rename_batch(chunk, limiter, progress, journal)
+        finally:
+            journal.close()
+        return total
+
+    def _rename_pairs(
+        self,
+        pairs: List[Tuple[str, str]],
+        callback: Optional[RenameCallback],
+        journal: Optional[_RenameJournal] = None,
+    ) -> None:
+        progress = _BatchedProgress(self._timed("progress", callback))
+        limiter = _RateLimiter(self._rename_rate) if self._rename_rate > 0 else None
+
+        if self._jobs > 1:
+            self.logger.debug("Renaming with {} threads".format(self._jobs))
+            pool = self._get_pool()
+            for level in self._rename_levels(pairs):
+                futures = [
+                    pool.submit(self._rename_batch, batch, limiter, progress, journal)
+                    for batch in level
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            self._rename_batch(pairs, limiter, progress, journal)
+        progress.flush()
+
+    def _rename_batch(
+        self,
+        pairs: Iterable[Tuple[str, str]],
+        limiter: Optional[_RateLimiter],
+        progress: _BatchedProgress,
+        journal: Optional[_RenameJournal] = None,
+    ) -> int:
+        total = 0
+        fds = self._open_dir_fds()
+        try:
+            for f, new_f in pairs:
+                if limiter is not None:
+                    limiter.wait()
+                if self._rename_item(f, new_f, True, fds) and journal is not None:
+                    journal.record(f)
+                progress.advance(f)
+                total += 1
+        finally:
+            if fds is not None:
+                fds.close()
+        return total
+
+    @staticmethod
+    def _rename_levels(
+        pairs: List[Tuple[str, str]]
+    ) -> List[List[List[Tuple[str, str]]]]:
+        # Groups the renames by depth (deepest first) and then by parent
+        # directory. Every entry of a level can be renamed concurrently with
+        # the others, since none of them is inside another one.
+        levels: Dict[int, Dict[str, List[Tuple[str, str]]]] = {}
+        for f, new_f in pairs:
+            parent = os.path.dirname(f)
+            by_parent = levels.setdefault(parent.count(os.sep), {})
+            by_parent.setdefault(parent, []).append((f, new_f))
+        return [list(levels[d].values()) for d in sorted(levels, reverse=True)]
+
+    def _check_path(self) -> None:
+        if not self._fs.isdir(self._path):
+            raise ValueError("Invalid path.")
+
+    def _walk(
+        self, topdown: bool = True, stop: Optional[threading.Event] = None
+    ) -> Iterator[_DirScan]:
+        # no other directory is listed once stop is set
+        def stopped() -> bool:
+            return stop is not None and stop.is_set()
+
+        if not self._isDirGood(self._path, resolve=False):
+            self.logger.debug('"{}" is inside an ignored directory'.format(self._path))
+            yield _DirScan(self._path, [], [], [], [])
+            return
+
+        if not self._recursive:
+            yield self._scan_dir(self._path)
+            return
+
+        get_scan: Callable[[str], _DirScan] = self._scan_dir
+        if self._jobs > 1 and not self._low_memory:
+            # list everything in parallel first, then replay it in walk order
+            get_scan = self._scan_tree_parallel(stop).pop
+
+        if topdown:
+            # same order as os.walk(topdown=True)
+            pending = [self._path]
+            while pending and not stopped():
+                scan = get_scan(pending.pop())
+                yield scan
+                pending.extend(reversed(scan.subdirs))
+            return
+
+        root = get_scan(self._path)
+        stack: List[Tuple[_DirScan, Iterator[str]]] = [(root, iter(root.subdirs))]
+        while stack:
+            scan, subdirs = stack[-1]
+            subdir = next(subdirs, None)
+            if subdir is None:
+                stack.pop()
+                yield scan
+            elif stopped():
+                return
+            else:
+                child = get_scan(subdir)
+                stack.append((child, iter(child.subdirs)))
+
+    def _scan_tree_parallel(
+        self, stop: Optional[threading.Event] = None
+    ) -> Dict[str, _DirScan]:
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        self.logger.debug("Scanning tree with {} threads".format(self._jobs))
+        scans: Dict[str, _DirScan] = {}
+        pool = self._get_pool()
+        pending: Set[Future[_DirScan]] = {pool.submit(self._scan_dir, self._path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                scan = future.result()
+                scans[scan.path] = scan
+                for subdir in scan.subdirs:
+                    pending.add(pool.submit(self._scan_dir, subdir))
+            if stop is not None and stop.is_set():
+                for future in pending:
+                    future.cancel()
+                break
+        return scans
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        converter = self._get_converter()
+        if self._process_pool_converter is not converter:
+            # the options changed since the workers were started
+            self._close_process_pool()
+        if self._process_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.logger.debug("Starting {} converter processes".format(self._processes))
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self._processes,
+                initializer=_init_convert_worker,
+                initargs=(converter,),
+            )
+            self._process_pool_converter = converter
+        return self._process_pool
+
+    def _close_process_pool(self) -> None:
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+            self._process_pool_converter = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # one pool for every scan and rename of this object, see close()
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._pool = ThreadPoolExecutor(max_workers=self._jobs)
+        return self._pool
+
+    def _scan_dir(self, path: str) -> _DirScan:
+        stats = self._stats
+        if stats is None:
+            return self._list_dir(path)
+        start = time.perf_counter()
+        scan = self._list_dir(path)
+        stats.timer("list_dir").add(time.perf_counter() - start)
+        hidden = sum(1 for name in scan.skipped if name.startswith("."))
+        stats.count("dirs_listed")
+        seen = len(scan.files) + len(scan.dirs) + len(scan.skipped)
+        stats.count("entries_seen", seen)
+        stats.count("entries_hidden", hidden)
+        stats.count("entries_ignored", len(scan.skipped) - hidden)
+        return scan
+
+    def _list_dir(self, path: str) -> _DirScan:
+        files: listStr = []
+        dirs: listStr = []
+        subdirs: listStr = []
+        skipped: listStr = []
+        stat: Optional[Tuple[int, int, int]] = None
+        if self._index is not None:
+            try:
+                stat = self._fs.stat(path)
+            except OSError as e:
+                self.logger.debug('Could not stat "{}": {}'.format(path, e))
+            else:
+                known_subdirs = self._index.lookup(path, stat)
+                if known_subdirs is not None:
+                    if self._stats is not None:
+                        self._stats.count("index_hits")
+                    join = os.path.join
+                    subdirs = [join(path, name) for name in known_subdirs]
+                    return _DirScan(path, files, dirs, subdirs, [])
+        ignored_dirs = self._ignored_dirs_set
+        ignored_exts = self._ignored_exts_set
+        try:
+            with self._fs.scandir(path) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        # hidden entries keep their names, but what is inside
+                        # a hidden directory is renamed like anything else
+                        skipped.append(entry.name)
+                        try:
+                            if entry.is_dir() and not entry.is_symlink():
+                                if not ignored_dirs or entry.path not in ignored_dirs:
+                                    subdirs.append(entry.path)
+                        except OSError:
+                            pass
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                        is_symlink = entry.is_symlink()
+                    except OSError:
+                        is_dir = is_symlink = False
+                    if is_symlink:
+                        if not self._isPathGood(entry.path):
+                            skipped.append(entry.name)
+                            continue
+                    else:
+                        # the parent is already known not to be ignored and
+                        # paths below self._path are resolved, so an exact
+                        # match is enough
+                        if (ignored_dirs and entry.path in ignored_dirs) or (
+                            ignored_exts and not self._isExtensionGood(entry.name)
+                        ):
+                            skipped.append(entry.name)
+                            continue
+                    if is_dir:
+                        dirs.append(entry.name)
+                        if not is_symlink:
+                            subdirs.append(entry.path)
+                    else:
+                        files.append(entry.name)
+        except OSError as e:
+            self.logger.debug('Could not list "{}": {}'.format(path, e))
+            stat = None
+        return _DirScan(path, files, dirs, subdirs, skipped, stat)
+
+    def _convert_in_processes(
+        self, scans: Iterable[_DirScan]
+    ) -> Iterator[Tuple[_DirScan, Optional[List[Optional[str]]]]]:
+        # Yields every scan with its names already converted by the process
+        # pool, in the same order. Names of consecutive directories are sent
+        # together, PROCESS_BATCH_SIZE at a time, and a remainder smaller than
+        # that is left to _convert_scan (None).
+        if self._processes <= 1:
+            for scan in scans:
+                yield scan, None
+            return
+
+        Batch = Tuple[List[Tuple[_DirScan, int]], List["Future[List[Optional[str]]]"]]
+        pending: Deque[Batch] = collections.deque()
+        max_pending = 2 * self._processes
+        scans_batch: List[Tuple[_DirScan, int]] = []
+        names: listStr = []
+
+        def split(batch: Batch) -> Iterator[Tuple[_DirScan, List[Optional[str]]]]:
+            batch_scans, futures = batch
+            converted: List[Optional[str]] = []
+            for future in futures:
+                converted.extend(future.result())
+            start = 0
+            for scan, count in batch_scans:
+                yield scan, converted[start : start + count]
+                start += count
+
+        try:
+            for scan in scans:
+                count = len(names)
+                if self._change != ChangeItemMode.dirs:
+                    names.extend(scan.files)
+                if self._change != ChangeItemMode.files:
+                    names.extend(scan.dirs)
+                scans_batch.append((scan, len(names) - count))
+                if len(names) < PROCESS_BATCH_SIZE:
+                    continue
+
+                pool = self._get_process_pool()
+                futures = [
+                    pool.submit(_convert_names, names[i : i + PROCESS_BATCH_SIZE])
+                    for i in range(0, len(names), PROCESS_BATCH_SIZE)
+                ]
+                pending.append((scans_batch, futures))
+                scans_batch, names = [], []
+                while pending and (
+                    len(pending) > max_pending or pending[0][1][-1].done()
+                ):
+                    yield from split(pending.popleft())
+
+            while pending:
+                yield from split(pending.popleft())
+        finally:
+            for _, futures in pending:
+                for future in futures:
+                    future.cancel()
+        for scan, _ in scans_batch:
+            yield scan, None
+
+    def _convert_scan(
+        self, scan: _DirScan, converted: Optional[List[Optional[str]]] = None
+    ) -> List[PlanEntry]:
+        convert = self._get_converter().convert
+        if converted is not None:
+            # already converted by a worker process, None means unchanged
+            results = iter(converted)
+
+            def convert(name: str) -> str:
+                new_name = next(results)
+                return name if new_name is None else new_name
+
+        self._scanned += len(scan.files) + len(scan.dirs)
+        stats = self._stats
+        if stats is not None:
+            start = time.perf_counter()
+        renames = []
+        if self._change != ChangeItemMode.dirs:
+            for name in scan.files:
+                new_name = convert(name)
+                if name != new_name:
+                    renames.append((name, new_name, "file"))
+        if self._change != ChangeItemMode.files:
+            for name in scan.dirs:
+                new_name = convert(name)
+                if name != new_name:
+                    renames.append((name, new_name, "dir"))
+        if stats is not None:
+            stats.timer("convert").add(time.perf_counter() - start)
+            stats.count("renames_planned", len(renames))
+
+        if not renames:
+            if scan.stat is not None and self._index is not None:
+                subdir_names = [os.path.basename(d) for d in scan.subdirs]
+                self._index.record(scan.path, scan.stat, subdir_names)
+            return []
+        return self._resolve_collisions(scan, renames)
+
+    def _resolve_collisions(
+        self, scan: _DirScan, renames: List[Tuple[str, str, str]]
+    ) -> List[PlanEntry]:
+        # Every name already in the directory plus every planned target, so
+        # collisions are found without touching the filesystem
+        normcase = os.path.normcase
+        taken = {normcase(n) for n in scan.files}
+        taken.update(normcase(n) for n in scan.dirs)
+        taken.update(normcase(n) for n in scan.skipped)
+        taken.update(_RESERVED_NAMES)
+
+        join = os.path.join
+        entries = []
+        for name, new_name, kind in renames:
+            key = normcase(new_name)
+            if key not in taken:
+                taken.add(key)
+                entries.append(
+                    PlanEntry(join(scan.path, name), join(scan.path, new_name), kind)
+                )
+                continue
+
+            original = join(scan.path, name)
+            target = join(scan.path, new_name)
+            if self._on_collision == CollisionPolicy.suffix:
+                base_name, name_extension = os.path.splitext(new_name)
+                if new_name in _RESERVED_NAMES:
+                    base_name, name_extension = "", ""
+                i = 1
+                while True:
+                    new_name = "{}_{}{}".format(base_name, i, name_extension)
+                    key = normcase(new_name)
+                    if key not in taken:
+                        break
+                    i += 1
+                taken.add(key)
+                suffixed = join(scan.path, new_name)
+                entries.append(PlanEntry(original, suffixed, kind, "suffix"))
+                self._collisions.append(Collision(original, target, suffixed))
+            else:
+                self._collisions.append(Collision(original, target, None))
+        return entries
+
+    def _survey_rules(self) -> List[Tuple[str, Callable[[str], str]]]:
+        # every enabled step of _get_converted_name_stepwise on its own
+        rules: List[Tuple[str, Callable[[str], str]]] = []
+        if self._convert_utf:
+            rules.append(("utf", self._convertUTF))
+        if self._convert_dots:
+            rules.append(("dots", self._convertDots))
+        if self._convert_brackets:
+            rules.append(("brackets", self._convertBrackets))
+        if self._remove_special_chars:
+            rules.append(("special_chars", self._removeSpecialChars))
+        rules.append(("whitespace", self._removeBlankSpaces))
+        return rules
+
+    def _survey_dir(self, path: str) -> Tuple[List[int], listStr]:
+        # the survey() counts of one directory, and its subdirectories
+        scan = self._scan_dir(path)
+        names: listStr = []
+        if self._change != ChangeItemMode.dirs:
+            names += scan.files
+        if self._change != ChangeItemMode.files:
+            names += scan.dirs
+        convert = self._get_converter().convert
+        rules = self._survey_rules()
+        counts = [len(names), 0] + [0] * len(rules)
+        for name in names:
+            if convert(name) == name:
+                continue
+            counts[1] += 1
+            for i, (_, rule) in enumerate(rules):
+                if rule(name) != name:
+                    counts[2 + i] += 1
+        return counts, scan.subdirs
+
+    def _plan_archive(self, members: List[Tuple[str, bool]]) -> Callable[[str], str]:
+        # Every directory of the archive is planned like a scanned one, then
+        # a member path is renamed one component at a time
+        tree: Dict[str, Tuple[Set[str], Set[str]]] = {}
+        for name, is_dir in members:
+            parts = name.split("/")
+            for i, part in enumerate(parts):
+                files, dirs = tree.setdefault("/".join(parts[:i]), (set(), set()))
+                (dirs if is_dir or i < len(parts) - 1 else files).add(part)
+
+        new_names: Dict[Tuple[str, str], str] = {}
+        for path, (files, dirs) in sorted(tree.items()):
+            if path and not self._recursive:
+                continue
+            skipped = [n for n in files | dirs if n.startswith(".")]
+            skipped += [
+                n
+                for n in files
+                if not n.startswith(".") and not self._isExtensionGood(n)
+            ]
+            scan = _DirScan(
+                path,
+                sorted(n for n in files if n and n not in skipped),
+                sorted(n for n in dirs if n and n not in skipped),
+                [],
+                skipped,
+            )
+            for entry in self._convert_scan(scan):
+                key = (path, os.path.basename(entry.original))
+                new_names[key] = os.path.basename(entry.target)
+
+        def rename(name: str) -> str:
+            parts = name.split("/")
+            return "/".join(
+                new_names.get(("/".join(parts[:i]), part), part)
+                for i, part in enumerate(parts)
+            )
+
+        return rename
+
+    @staticmethod
+    def _zip_members(filename: str) -> List[Tuple[str, bool]]:
+        import zipfile
+
+        with zipfile.ZipFile(filename) as archive:
+            return [
+                (info.filename.rstrip("/"), info.is_dir())
+                for info in archive.infolist()
+            ]
+
+    def _copy_zip(
+        self, filename: str, output: str, rename: Callable[[str], str]
+    ) -> None:
+        # The compressed data of every member is copied as it is, under a new
+        # local header. The ZipFile only writes the central directory.
+        import copy
+        import zipfile
+
+        with zipfile.ZipFile(filename) as source, open(
+            filename, "rb"
+        ) as raw, zipfile.ZipFile(output, "w") as target:
+            target.comment = source.comment
+            out = cast(BinaryIO, target.fp)
+            for info in source.infolist():
+                raw.seek(info.header_offset)
+                header = raw.read(ZIP_LOCAL_HEADER_SIZE)
+                if header[:4] != b"PK\x03\x04":
+                    raise zipfile.BadZipFile(
+                        "Bad local header for {}".format(info.filename)
+                    )
+                name_length, extra_length = struct.unpack("<HH", header[26:30])
+                raw.seek(name_length + extra_length, os.SEEK_CUR)
+
+                new_info = copy.copy(info)
+                name = info.filename
+                stem = name.rstrip("/")
+                new_info.filename = rename(stem) + name[len(stem) :]
+                # The sizes go in the new local header, not after the data,
+                # except for encrypted members: their password check byte
+                # depends on whether there is a data descriptor
+                descriptor = bool(info.flag_bits & 0x01 and info.flag_bits & 0x08)
+                if not descriptor:
+                    new_info.flag_bits &= ~0x08
+                new_info.extra = _strip_zip64_extra(info.extra)
+                new_info.header_offset = out.tell()
+                zip64 = max(info.compress_size, info.file_size) > zipfile.ZIP64_LIMIT
+                out.write(new_info.FileHeader(zip64))
+                _copy_bytes(raw, out, info.compress_size)
+                if descriptor:
+                    out.write(
+                        struct.pack(
+                            "<4sLQQ" if zip64 else "<4sLLL",
+                            b"PK\x07\x08",
+                            info.CRC,
+                            info.compress_size,
+                            info.file_size,
+                        )
+                    )
+                target.filelist.append(new_info)
+                target.NameToInfo[new_info.filename] = new_info
+                target.start_dir = out.tell()
+
+    @staticmethod
+    def _tar_members(filename: str) -> List[Tuple[str, bool]]:
+        import tarfile
+
+        # headers only, the data of an uncompressed archive is skipped over
+        with tarfile.open(filename, "r:*") as archive:
+            return [(member.name, member.isdir()) for member in archive]
+
+    def _copy_tar(
+        self, filename: str, output: str, rename: Callable[[str], str]
+    ) -> None:
+        import copy
+        import tarfile
+
+        # the output is compressed according to its own suffix
+        mode: Any = "w|" + _tar_compression(output)
+        with tarfile.open(filename, "r|*") as source, tarfile.open(
+            output, mode, format=tarfile.PAX_FORMAT
+        ) as target:
+            for member in source:
+                new_member = copy.copy(member)
+                new_member.name = rename(member.name)
+                if member.islnk():
+                    # hard links point to other members, symlinks to paths
+                    new_member.linkname = rename(member.linkname)
+                # the names read from pax headers would be written instead
+                new_member.pax_headers = {
+                    k: v
+                    for k, v in member.pax_headers.items()
+                    if k not in ("path", "linkpath")
+                }
+                data = source.extractfile(member) if member.isreg() else None
+                target.addfile(new_member, data)
+
+    @staticmethod
+    def _7z_members(filename: str) -> List[Tuple[str, bool]]:
+        py7zr = _import_py7zr()
+        with py7zr.SevenZipFile(filename) as archive:
+            return [(f.filename, f.is_directory) for f in archive.list()]
+
+    def _copy_7z(
+        self, filename: str, output: str, rename: Callable[[str], str]
+    ) -> None:
+        # py7zr can not copy compressed data, the members are decompressed
+        # once and compressed again
+        import io
+        import tempfile
+
+        py7zr = _import_py7zr()
+        with py7zr.SevenZipFile(filename) as source:
+            infos = source.list()
+            sizes = {f.filename: f.uncompressed for f in infos}
+            contents = _read_7z(source, sizes)
+        try:
+            with tempfile.TemporaryDirectory() as empty_dir:
+                with py7zr.SevenZipFile(output, "w") as target:
+                    for info in infos:
+                        new_name = rename(info.filename)
+                        if info.is_directory:
+                            target.write(empty_dir, new_name)
+                            continue
+                        data = contents.get(info.filename) or io.BytesIO()
+                        data.seek(0)
+                        target.writef(data, new_name)
+        finally:
+            for data in contents.values():
+                data.close()
+
+    def _check_collisions(self) -> None:
+        if self._collisions and self._on_collision == CollisionPolicy.abort:
+            raise CollisionError(self._collisions)
+
+    def _create_watcher(self) -> _Watcher:
+        if self._watch_backend != WatchBackend.poll:
+            try:
+                watcher = _InotifyWatcher()
+            except (OSError, AttributeError) as e:
+                if self._watch_backend == WatchBackend.inotify:
+                    raise
+                self.logger.debug("inotify unavailable ({})".format(e))
+            else:
+                self.logger.debug("Watching with inotify")
+                return watcher
+        self.logger.debug("Watching by polling")
+        return _PollingWatcher()
+
+    def _watch_tree(self, watcher: _Watcher) -> None:
+        for scan in self._walk(topdown=True):
+            watcher.add(scan.path)
+
+    def _wait_for_changes(self, watcher: _Watcher, stop: threading.Event) -> Set[str]:
+        # Waits for a change, then keeps collecting changes until none shows up
+        # for the debounce time
+        dirty = watcher.read(WATCH_POLL_INTERVAL)
+        if not dirty:
+            return dirty
+        deadline = time.monotonic() + WATCH_MAX_DELAY
+        while not stop.is_set():
+            timeout = min(self._watch_debounce, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            changes = watcher.read(timeout)
+            if not changes:
+                break
+            dirty |= changes
+        return dirty
+
+    def _watch_pass(self, watcher: _Watcher, dirty: Set[str]) -> int:
+        self._collisions = []
+        entries: List[PlanEntry] = []
+        pending = sorted(dirty)
+        while pending:
+            path = pending.pop()
+            if not os.path.isdir(path) or not self._isDirGood(path, resolve=False):
+                watcher.discard(path)
+                continue
+            scan = self._scan_dir(path)
+            if self._recursive:
+                for subdir in scan.subdirs:
+                    if watcher.known(subdir):
+                        continue
+                    # new or moved in, its whole content is new as well
+                    try:
+                        watcher.add(subdir)
+                    except OSError as e:
+                        self.logger.debug('Could not watch "{}": {}'.format(subdir, e))
+                    pending.append(subdir)
+            entries.extend(self._convert_scan(scan))
+        self._check_collisions()
+        if not entries:
+            return 0
+
+        # deepest first, so nothing is renamed before its contents
+        entries.sort(key=lambda e: e.original.count(os.sep), reverse=True)
+        self.logger.debug(
+            "{} changed directories, {} renames".format(len(dirty), len(entries))
+        )
+        self.rename_list([e.original for e in entries], [e.target for e in entries])
+        return len(entries)
+
+    def _index_key(self) -> str:
+        import hashlib
+
+        options = (
+            __version__,
+            self._convert_utf,
+            self._convert_dots,
+            self._convert_brackets,
+            self._remove_special_chars,
+            self._change.name,
+            sorted(self._ignored_dirs),
+            sorted(self._ignored_exts),
+            sorted(self._utf_chars.items()),
+            sorted(self._special_chars.items()),
+        )
+        return hashlib.sha1(repr(options).encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _open_index(self) -> None:
+        if self._index_file is None:
+            return
+        self._index = _ScanIndex(self._index_file, self._index_key())
+        self.logger.debug('Opened index "{}"'.format(self._index_file))
+
+    def _close_index(self) -> None:
+        if self._index is None:
+            return
+        saved = self._index.save()
+        self._index.close()
+        self._index = None
+        self.logger.debug("Saved {} clean directories to index".format(saved))
+
+    def _oslistdir(
+        self, path: str, ignoredDirs: listStr = [], ignoredExts: listStr = []
+    ) -> listStr:
+        self.logger.debug("_oslistdir called")
+        list_dirs = []
+        ignoredDirs = [f[:-1] if f[-1] == "/" else f for f in ignoredDirs]
+        ignoredExts = ["." + f for f in ignoredExts if not f.startswith(".")]
+        list_dirs = [
+            f
+            for f in os.listdir(path)
+            if (self._isPathGood(f) and not f.startswith("."))
+        ]
+        return list_dirs
+
+    def _isPathGood(self, path: str, resolve: bool = True) -> bool:
+        return self._isDirGood(path, resolve) and self._isExtensionGood(path)
+
+    def _isDirGood(self, dir: str, resolve: bool = True) -> bool:
+        if not self._ignored_dirs_set:
+            return True
+        full_dir = self._fs.realpath(dir) if resolve else dir
+        # the path or any of its ancestors being ignored, one component at a time
+        while full_dir not in self._ignored_dirs_set:
+            parent = os.path.dirname(full_dir)
+            if parent == full_dir:
+                return True
+            full_dir = parent
+        return False
+
+    def _isExtensionGood(self, file: str) -> bool:
+        ext = os.path.splitext(file)[-1]
+        return ext not in self._ignored_exts_set
+
+    def _update_print(self) -> None:
+        self.logger.debug("_update_print called")
+        if self._quiet:
+            self._print = lambda *args, **kwargs: None
+        else:
+            self._print = lambda *args, **kwargs: _get_console().print(*args, **kwargs)
+            self._print = self._timed("output", self._print) or self._print
+
+    def _get_converter(self) -> CompiledConverter:
+        if self._converter is None:
+            self.logger.debug("Compiling name converter")
+            self._converter = CompiledConverter(
+                self._utf_chars,
+                self._special_chars,
+                convert_utf=self._convert_utf,
+                convert_dots=self._convert_dots,
+                convert_brackets=self._convert_brackets,
+                remove_special_chars=self._remove_special_chars,
+                cache_size=self._name_cache_size,
+            )
+        return self._converter
+
+    def _log_cache_stats(self) -> None:
+        if self._converter is None:
+            return
+        info = self._converter.cache_info()
+        if info is None:
+            return
+        hits, misses, size = info
+        total = hits + misses
+        rate = 100.0 * hits / total if total else 0.0
+        self.logger.debug(
+            "Name cache: {} hits, {} misses ({:.1f}% hit rate), {} entries".format(
+                hits, misses, rate, size
+            )
+        )
+
+    def _get_converted_name(self, name: str) -> str:
+        return self._get_converter().convert(name)
+
+    def _get_converted_name_stepwise(self, name: str) -> str:
+        if self._convert_utf:
+            name = self._convertUTF(name)
+        if self._convert_dots:
+            name = self._convertDots(name)
+        if self._convert_brackets:
+            name = self._convertBrackets(name)
+        if self._remove_special_chars:
+            name = self._removeSpecialChars(name)
+
+        name = self._removeBlankSpaces(name)
+        return name
+
+    def _removeBlankSpaces(self, name: str) -> str:
+        name = re.sub(r"\s+", r"_", name)
+        name = re.sub(r"_+", r"_", name)
+        name = re.sub(r"(^_|_$)", r"", name)
+        name = re.sub(r"_\.", r".", name)
+        return name
+
+    def _removeSpecialChars(self, name: str) -> str:
+        for char in name:
+            if char in self._special_chars:
+                name = name.replace(char, self._special_chars[char])
+        return name
+
+    def _convertUTF(self, name: str) -> str:
+        for char in name:
+            if char in self._utf_chars:
+                name = name.replace(char, self._utf_chars[char])
+        return name
+
+    def _convertDots(self, name: str) -> str:
+        base_name = os.path.splitext(name)[0]
+        name_extension = os.path.splitext(name)[-1]
+        name = base_name.replace(".", "_").replace(",", "_") + name_extension
+        return name
+
+    def _convertBrackets(self, name: str) -> str:
+        return re.sub(r"\(|\)|\[|\]|\{|\}", r"", name)
+
+    def _fixDotInIgnoredExtensions(self) -> None:
+        for i in range(len(self._ignored_exts)):
+            ext = self._ignored_exts[i]
+            if not ext.startswith("."):
+                self._ignored_exts[i] = "." + ext
+        self._ignored_exts_set = frozenset(self._ignored_exts)
+
+    def _fullPathIgnoredDirs(self) -> None:
+        self._ignored_dirs = [
+            self._fs.realpath(os.path.join(self._path, d))
+            for d in self._ignored_dirs_input
+        ]
+        self._ignored_dirs_set = frozenset(self._ignored_dirs)
+
+    # Setters
+
+    def setRecursive(self, recursive: bool) -> None:
+        self._recursive = recursive
+
+    def setJobs(self, jobs: int) -> None:
+        if jobs < 1:
+            raise ValueError("Number of jobs must be at least 1.")
+        if jobs != self._jobs:
+            self.close()
+        self._jobs = jobs
+
+    def setProcesses(self, processes: int) -> None:
+        # number of processes converting names, 1 converts them in this one
+        if processes < 1:
+            raise ValueError("Number of processes must be at least 1.")
+        if processes != self._processes:
+            self._close_process_pool()
+        self._processes = processes
+
+    def setLowMemory(self, lowMemory: bool) -> None:
+        # scans one directory at a time even with several jobs, see rename_tree
+        self._low_memory = lowMemory
+
+    def setRenameRate(self, rate: float) -> None:
+        # maximum number of renames per second, 0 means no limit
+        if rate < 0:
+            raise ValueError("Rename rate can not be negative.")
+        self._rename_rate = rate
+
+    def setNameCacheSize(self, size: int) -> None:
+        # 0 disables the cache
+        if size < 0:
+            raise ValueError("Cache size can not be negative.")
+        self._name_cache_size = size
+        self._converter = None
+
+    def setRuleFile(self, ruleFile: Optional[str]) -> None:
+        # see load_rules, None goes back to the built-in rules
+        if ruleFile is None:
+            rules = TransliterationRules(cesp._utf_chars, cesp._special_chars)
+        else:
+            rules = load_rules(ruleFile)
+        self._utf_chars = rules.utf_chars
+        self._special_chars = rules.special_chars
+        self._rule_file = ruleFile
+        self._converter = None
+
+    def setStats(self, enabled: bool) -> None:
+        # starts collecting counters and timings from scratch, see getStats
+        self._stats = _Stats() if enabled else None
+        self._update_print()
+
+    def setIndexFile(self, indexFile: Optional[str]) -> None:
+        self._index_file = indexFile
+
+    def setJournal(self, journalFile: Optional[str]) -> None:
+        self._journal_file = journalFile
+
+    def setIgnoredDirs(self, ignoredDirs: listStr) -> None:
+        # relative directories are relative to the path, whenever it is set
+        self._ignored_dirs_input = list(ignoredDirs)
+        self._fullPathIgnoredDirs()
+
+    def setIgnoredExts(self, ignoredExts: listStr) -> None:
+        self._ignored_exts = ignoredExts
+        self._fixDotInIgnoredExtensions()
+
+    def setUTF(self, convertUTF: bool) -> None:
+        self._convert_utf = convertUTF
+        self._converter = None
+
+    def setDots(self, convertDots: bool) -> None:
+        self._convert_dots = convertDots
+        self._converter = None
+
+    def setBrackets(self, convertBrackets: bool) -> None:
+        self._convert_brackets = convertBrackets
+        self._converter = None
+
+    def setSpecialChars(self, removeSpecialChars: bool) -> None:
+        self._remove_special_chars = removeSpecialChars
+        self._converter = None
+
+    def setQuiet(self, quiet: bool) -> None:
+        self._quiet = quiet
+        self._update_print()
+
+    def setNoChange(self, noChange: bool) -> None:
+        self._no_change = noChange
+
+    def setChange(self, changeOption: ChangeItemMode) -> None:
+        self._change = changeOption
+
+    def setCollisionPolicy(self, policy: CollisionPolicy) -> None:
+        self._on_collision = policy
+
+    def setWatchBackend(self, backend: WatchBackend) -> None:
+        self._watch_backend = backend
+
+    def setWatchDebounce(self, seconds: float) -> None:
+        if seconds < 0:
+            raise ValueError("Debounce time can not be negative.")
+        self._watch_debounce = seconds
+
+    def setPath(self, path: str) -> None:
+        self._path = self._fs.realpath(path)
+        self._fullPathIgnoredDirs()
+
+    def setFileSystem(self, fs: FileSystem) -> None:
+        # what is walked and renamed, the path is resolved again on it
+        self._fs = fs
+        self.setPath(self._path)
+
+    # Getters
+
+    @staticmethod
+    def getVersion() -> str:
+        return __version__
+
+    def getPath(self) -> str:
+        return self._path
+
+    def isRecursive(self) -> bool:
+        return self._recursive
+
+    def getJobs(self) -> int:
+        return self._jobs
+
+    def getProcesses(self) -> int:
+        return self._processes
+
+    def getFileSystem(self) -> FileSystem:
+        return self._fs
+
+    def isLowMemory(self) -> bool:
+        return self._low_memory
+
+    def getRenameRate(self) -> float:
+        return self._rename_rate
+
+    def getRuleFile(self) -> Optional[str]:
+        return self._rule_file
+
+    def getStats(self) -> Optional[Dict[str, Any]]:
+        # JSON-serializable counters and timings since setStats(True)
+        return self._stats.report() if self._stats is not None else None
+
+    def getIndexFile(self) -> Optional[str]:
+        return self._index_file
+
+    def getJournal(self) -> Optional[str]:
+        return self._journal_file
+
+    def getIgnoredDirs(self) -> listStr:
+        return self._ignored_dirs
+
+    def getIgnoredExtensions(self) -> listStr:
+        return self._ignored_exts
+
+    def whatToChange(self) -> ChangeItemMode:
+        return self._change
+
+    def isNoChange(self) -> bool:
+        return self._no_change
+
+    def isQuiet(self) -> bool:
+        return self._quiet
+
+    def getCollisionPolicy(self) -> CollisionPolicy:
+        return self._on_collision
+
+    def getWatchBackend(self) -> WatchBackend:
+        return self._watch_backend
+
+    def getWatchDebounce(self) -> float:
+        return self._watch_debounce
+
+    def getCollisions(self) -> List[Collision]:
+        # collisions found by the last fetch
+        return self._collisions
+
+    def getScannedCount(self) -> int:
+        # entries listed by the last fetch
+        return self._scanned
+
+
+def _print_collisions(collisions: List[Collision], aborted: bool = False) -> None:
+    if not collisions:
+        return
+    console = _get_console()
+    console.print(f"[bold yellow]{len(collisions)} name collisions:[/]")
+    for collision in collisions:
+        if aborted:
+            outcome = "[bold red]aborting[/]"
+        elif collision.renamed is None:
+            outcome = "[bold red]skipped[/]"
+        else:
+            outcome = f"renamed to [bold]{os.path.basename(collision.renamed)}[/]"
+        console.print(
+            f"  {collision.original} -> [bold]{os.path.basename(collision.target)}[/]"
+            f" already taken, {outcome}"
+        )
+
+
+def _print_aborted(e: CollisionError, quiet: bool, applied: int = 0) -> None:
+    if applied:
+        outcome = (
+            f"{applied} renames were already applied, no further changes were made"
+        )
+    else:
+        outcome = "no changes were made"
+    if quiet:
+        print(f"cesp: {e} Aborted, {outcome}", file=sys.stderr)
+    else:
+        _print_collisions(e.collisions, aborted=True)
+        _get_console().print(f"[bold red]Aborted, {outcome}[/]")
+
+
+def _fetch_and_rename(cesper: cesp) -> None:
+    root_logger.debug("Calling cesper.fetch()")
+
+    if cesper.isQuiet():
+        og_files, ren_files = cesper.fetch()
+        if og_files:
+            cesper.rename_list(og_files, ren_files)
+        return
+
+    from rich.progress import BarColumn, Progress, SpinnerColumn, TimeRemainingColumn
+
+    console = _get_console()
+
+    fetching_message = "Fetching files..."
+    with Progress(
+        SpinnerColumn(),
+        fetching_message,
+        "[dim]{task.fields[extra]}[/]",
+        console=console,
+        transient=True,
+    ) as progress:
+        task = progress.add_task(description="", start=False, extra="")
+        og_files, ren_files = cesper.fetch(
+            lambda f, total: progress.update(task, extra=f"found {total} - latest: {f}")
+        )
+
+    files_num = len(og_files)
+
+    console.print(f"[bold green]OK![/] {fetching_message}")
+    _print_collisions(cesper.getCollisions())
+    console.print(f"Found {files_num} files")
+
+    if files_num > 0:
+
+        if cesper.isNoChange():
+            cesper.rename_list(og_files, ren_files)
+            console.print("[bold red]No changes were made[/]")
+        else:
+            with Progress(
+                "[progress.description]{task.description}",
+                BarColumn(),
+                "[progress.percentage]{task.percentage:>3.0f}%",
+                TimeRemainingColumn(),
+                "{task.fields[file]}",
+                console=console,
+            ) as progress:
+                task = progress.add_task(
+                    description="Renaming...", total=files_num, file=""
+                )
+
+                def advance(done: int, f: str) -> None:
+                    f_name = os.path.basename(f)
+                    progress.update(task, advance=done, file=f"- [dim]{f_name}[/]")
+
+                cesper.rename_list(og_files, ren_files, advance)
+                progress.update(task, file="")
+
+
+def _rename_with_spinner(
+    cesper: cesp, rename: Callable[[Optional[RenameCallback]], int]
+) -> int:
+    # for renames whose total is not known upfront
+    if cesper.isQuiet():
+        return rename(None)
+
+    from rich.progress import Progress, SpinnerColumn
+
+    console = _get_console()
+    with Progress(
+        SpinnerColumn(),
+        "[progress.description]{task.description}",
+        "{task.completed} done",
+        "{task.fields[file]}",
+        console=console,
+    ) as progress:
+        task = progress.add_task(description="Renaming...", total=None, file="")
+
+        def advance(done: int, f: str) -> None:
+            f_name = os.path.basename(f)
+            progress.update(task, advance=done, file=f"- [dim]{f_name}[/]")
+
+        files_num = rename(advance)
+        progress.update(task, file="")
+    return files_num
+
+
+def _rename_tree(cesper: cesp) -> None:
+    root_logger.debug("Calling cesper.rename_tree()")
+    files_num = _rename_with_spinner(cesper, cesper.rename_tree)
+    if cesper.isQuiet():
+        return
+
+    console = _get_console()
+    _print_collisions(cesper.getCollisions())
+    console.print(f"Processed {files_num} renames")
+    if cesper.isNoChange():
+        console.print("[bold red]No changes were made[/]")
+
+
+def _filter_paths(cesper: cesp, separator: bytes, plan_out: Optional[str]) -> None:
+    root_logger.debug("Reading paths from stdin")
+    pairs = cesper.convert_paths(cesper.read_paths(sys.stdin.buffer, separator))
+    if plan_out is not None:
+        files_num = cesper.write_plan(plan_out, pairs)
+        if not cesper.isQuiet():
+            _get_console().print(f"Wrote {files_num} renames to [bold]{plan_out}[/]")
+        return
+
+    files_num = _rename_with_spinner(
+        cesper, lambda callback: cesper.rename_iter(pairs, callback)
+    )
+    if cesper.isQuiet():
+        return
+
+    console = _get_console()
+    _print_collisions(cesper.getCollisions())
+    console.print(f"Processed {files_num} renames from stdin")
+    if cesper.isNoChange():
+        console.print("[bold red]No changes were made[/]")
+
+
+def _rename_archive(cesper: cesp, filename: str, output: str) -> None:
+    import tarfile
+    import zipfile
+
+    root_logger.debug("Calling cesper.rename_archive()")
+    try:
+        pairs = cesper.rename_archive(filename, output)
+    except CollisionError:
+        raise
+    except (OSError, ValueError, EOFError, tarfile.TarError, zipfile.BadZipFile) as e:
+        if cesper.isQuiet():
+            print(f"cesp: could not rename {filename}: {e}", file=sys.stderr)
+        else:
+            _get_console().print(f"[bold red]Could not rename {filename}:[/] {e}")
+        raise SystemExit(1)
+    if cesper.isQuiet():
+        return
+
+    console = _get_console()
+    for member, new_member in pairs:
+        console.print(f"{member} [bold]->[/] [bold green]{new_member}[/]")
+    _print_collisions(cesper.getCollisions())
+    console.print(f"Renamed {len(pairs)} archive members")
+    if cesper.isNoChange():
+        console.print("[bold red]No changes were made[/]")
+    else:
+        console.print(f"Wrote [bold]{output}[/]")
+
+
+def _survey(cesper: cesp, probes: int, seed: Optional[int]) -> None:
+    root_logger.debug("Calling cesper.survey()")
+    if cesper.isQuiet():
+        report = cesper.survey(probes, seed)
+    else:
+        from rich.progress import Progress, SpinnerColumn
+
+        with Progress(
+            SpinnerColumn(),
+            "Surveying...",
+            console=_get_console(),
+            transient=True,
+        ):
+            report = cesper.survey(probes, seed)
 
-    def rename_list(self, original_files: listStr, renamed_files: listStr) -> int:
+    rows = [(f"dirs at depth {d}", e) for d, e in enumerate(report.dirs)]
+    rows += [("entries", report.entries), ("renames", report.renames)]
+    rows += [(f"renamed by {name}", e) for name, e in report.rules.items()]
+    if cesper.isQuiet():
+        # the estimates are the output, one tab separated line each
+        for name, e in rows:
+            print(f"{name}\t{e.value:.0f}\t{e.low:.0f}\t{e.high:.0f}")
+        return
 
-        self.logger.debug("Renaming files")
-        for f, new_f in zip(original_files, renamed_files):
-            self.rename_item(f, new_f)
+    from rich.table import Table
 
-        if not self._no_change:
-            self.logger.debug("Renamed {} files".format(len(renamed_files)))
+    console = _get_console()
+    table = Table("", "Estimate", "95% interval")
+    for name, e in rows:
+        table.add_row(name, f"{e.value:,.0f}", f"{e.low:,.0f} - {e.high:,.0f}")
+    console.print(table)
+    console.print(
+        f"{report.probes:,} probes listed {report.dirs_listed:,} directories "
+        f"in {report.seconds:.2f} seconds, nothing was renamed"
+    )
 
-        self.logger.debug("rename_list method finished")
-        return 0
 
-    # helper Functions
+def _read_roots(filename: str) -> listStr:
+    # one root per line, "-" reads them from stdin
+    if filename == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(filename, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line for line in lines if line]
 
-    def _oslistdir(
-        self, path: str, ignoredDirs: listStr = [], ignoredExts: listStr = []
-    ) -> listStr:
-        self.logger.debug("_oslistdir called")
-        list_dirs = []
-        ignoredDirs = [f[:-1] if f[-1] == "/" else f for f in ignoredDirs]
-        ignoredExts = ["." + f for f in ignoredExts if not f.startswith(".")]
-        list_dirs = [
-            f
-            for f in os.listdir(path)
-            if (self._isPathGood(f) and not f.startswith("."))
-        ]
-        return list_dirs
 
-    def _isPathGood(self, path: str) -> bool:
-        return self._isDirGood(path) and self._isExtensionGood(path)
+def _batch(cesper: cesp, roots: listStr) -> bool:
+    # returns whether every root was processed
+    failed = 0
 
-    def _isDirGood(self, dir: str) -> bool:
-        full_dir = os.path.realpath(dir)
-        for ignored_dir in self._ignored_dirs:
-            if ignored_dir in full_dir:
-                return False
-        return True
+    if cesper.isQuiet():
+        for report in cesper.batch(roots):
+            if report.error is not None:
+                failed += 1
+                print(f"cesp: {report.path}: {report.error}", file=sys.stderr)
+        return failed == 0
 
-    def _isExtensionGood(self, file: str) -> bool:
-        ext = os.path.splitext(file)[-1]
-        return ext not in self._ignored_exts
+    from rich.table import Table
 
-    def _update_print(self) -> None:
-        self.logger.debug("_update_print called")
-        if self._quiet:
-            self._print = lambda *args, **kwargs: None
+    console = _get_console()
+    table = Table("Root", "Entries", "Renames", "Seconds", "Entries/s")
+    scanned = renames = 0
+    start = time.perf_counter()
+
+    def rate(entries: int, seconds: float) -> str:
+        return f"{entries / seconds:,.0f}" if seconds > 0 else "-"
+
+    for report in cesper.batch(roots):
+        scanned += report.scanned
+        renames += report.renames
+        if report.error is not None:
+            failed += 1
+            if isinstance(report.error, CollisionError):
+                _print_collisions(report.error.collisions, aborted=True)
+            console.print(f"[bold red]{report.path}: {report.error}[/]")
         else:
-            self._print = lambda *args, **kwargs: console.print(*args, **kwargs)
+            _print_collisions(cesper.getCollisions())
+        table.add_row(
+            report.path if report.error is None else f"[red]{report.path}[/]",
+            f"{report.scanned:,}",
+            f"{report.renames:,}",
+            f"{report.seconds:.2f}",
+            rate(report.scanned, report.seconds),
+        )
 
-    def _get_converted_name(self, name: str) -> str:
-        if self._convert_utf:
-            name = self._convertUTF(name)
-        if self._convert_dots:
-            name = self._convertDots(name)
-        if self._convert_brackets:
-            name = self._convertBrackets(name)
-        if self._remove_special_chars:
-            name = self._removeSpecialChars(name)
+    elapsed = time.perf_counter() - start
+    table.add_section()
+    table.add_row(
+        f"[bold]{len(roots)} roots[/]",
+        f"{scanned:,}",
+        f"{renames:,}",
+        f"{elapsed:.2f}",
+        rate(scanned, elapsed),
+    )
+    console.print(table)
+    if failed:
+        console.print(f"[bold red]{failed} roots failed[/]")
+    if cesper.isNoChange():
+        console.print("[bold red]No changes were made[/]")
+    return failed == 0
 
-        name = self._removeBlankSpaces(name)
-        return name
 
-    def _removeBlankSpaces(self, name: str) -> str:
-        name = re.sub(r"\s+", r"_", name)
-        name = re.sub(r"_+", r"_", name)
-        name = re.sub(r"(^_|_$)", r"", name)
-        name = re.sub(r"_\.", r".", name)
-        return name
+def _write_plan(cesper: cesp, filename: str) -> None:
+    root_logger.debug("Calling cesper.iter_fetch()")
 
-    def _removeSpecialChars(self, name: str) -> str:
-        for char in name:
-            if char in self._special_chars:
-                name = name.replace(char, self._special_chars[char])
-        return name
+    if cesper.isQuiet():
+        cesper.write_plan(filename, cesper.iter_fetch())
+        return
 
-    def _convertUTF(self, name: str) -> str:
-        for char in name:
-            if char in self._utf_chars:
-                name = name.replace(char, self._utf_chars[char])
-        return name
+    from rich.progress import Progress, SpinnerColumn
 
-    def _convertDots(self, name: str) -> str:
-        base_name = os.path.splitext(name)[0]
-        name_extension = os.path.splitext(name)[-1]
-        name = base_name.replace(".", "_").replace(",", "_") + name_extension
-        return name
+    console = _get_console()
 
-    def _convertBrackets(self, name: str) -> str:
-        return re.sub(r"\(|\)|\[|\]|\{|\}", r"", name)
+    fetching_message = "Fetching files..."
+    with Progress(
+        SpinnerColumn(),
+        fetching_message,
+        "[dim]{task.fields[extra]}[/]",
+        console=console,
+        transient=True,
+    ) as progress:
+        task = progress.add_task(description="", start=False, extra="")
+        files_num = cesper.write_plan(
+            filename,
+            cesper.iter_fetch(
+                lambda f, total: progress.update(
+                    task, extra=f"found {total} - latest: {f}"
+                )
+            ),
+        )
 
-    def _fixDotInIgnoredExtensions(self) -> None:
-        for i in range(len(self._ignored_exts)):
-            ext = self._ignored_exts[i]
-            if not ext.startswith("."):
-                self._ignored_exts[i] = "." + ext
+    console.print(f"[bold green]OK![/] {fetching_message}")
+    _print_collisions(cesper.getCollisions())
+    console.print(f"Wrote {files_num} renames to [bold]{filename}[/]")
 
-    def _fullPathIgnoredDirs(self) -> None:
-        for i in range(len(self._ignored_dirs)):
-            self._ignored_dirs[i] = os.path.realpath(
-                os.path.join(self._path, self._ignored_dirs[i])
-            )
 
-    def _append_upper_to_dict(self, d: Dict[str, str]) -> None:
+def _apply_plan(cesper: cesp, filename: str) -> None:
+    pairs = cesper.read_plan(filename)
+    files_num = _rename_with_spinner(
+        cesper, lambda callback: cesper.rename_iter(pairs, callback)
+    )
+    if cesper.isQuiet():
+        return
 
-        keys = list(self._utf_chars.keys())
+    console = _get_console()
+    console.print(f"Processed {files_num} renames from [bold]{filename}[/]")
+    if cesper.isNoChange():
+        console.print("[bold red]No changes were made[/]")
 
-        for key in keys:
-            key_upper = key.upper()
-            value_upper = self._utf_chars[key].upper()
-            self._utf_chars[key_upper] = value_upper
 
-    # Setters
+def _replay_journal(cesper: cesp, filename: str, undo: bool) -> None:
+    replay = cesper.undo_journal if undo else cesper.resume_journal
+    try:
+        files_num = _replay_with_progress(cesper, replay, filename, undo)
+    except (OSError, ValueError) as e:
+        # a missing, unreadable or malformed journal
+        action = "undo" if undo else "resume"
+        if cesper.isQuiet():
+            print(f"cesp: could not {action} {filename}: {e}", file=sys.stderr)
+        else:
+            _get_console().print(f"[bold red]Could not {action} {filename}:[/] {e}")
+        raise SystemExit(1)
+    if cesper.isQuiet():
+        return
 
-    def setRecursive(self, recursive: bool) -> None:
-        self._recursive = recursive
+    console = _get_console()
+    action = "Reverted" if undo else "Resumed"
+    console.print(f"{action} {files_num} renames from [bold]{filename}[/]")
+    if cesper.isNoChange():
+        console.print("[bold red]No changes were made[/]")
 
-    def setIgnoredDirs(self, ignoredDirs: listStr) -> None:
-        self._ignored_dirs = ignoredDirs
-        self._fullPathIgnoredDirs()
 
-    def setIgnoredExts(self, ignoredExts: listStr) -> None:
-        self._ignored_exts = ignoredExts
-        self._fixDotInIgnoredExtensions()
+def _replay_with_progress(
+    cesper: cesp,
+    replay: Callable[[str, Optional[RenameCallback]], int],
+    filename: str,
+    undo: bool,
+) -> int:
+    if cesper.isQuiet():
+        return replay(filename, None)
 
-    def setUTF(self, convertUTF: bool) -> None:
-        self._convert_utf = convertUTF
+    from rich.progress import Progress, SpinnerColumn
 
-    def setDots(self, convertDots: bool) -> None:
-        self._convert_dots = convertDots
+    with Progress(
+        SpinnerColumn(),
+        "[progress.description]{task.description}",
+        "{task.completed} done",
+        "{task.fields[file]}",
+        console=_get_console(),
+    ) as progress:
+        description = "Undoing..." if undo else "Resuming..."
+        task = progress.add_task(description=description, total=None, file="")
 
-    def setBrackets(self, convertBrackets: bool) -> None:
-        self._convert_brackets = convertBrackets
+        def advance(done: int, f: str) -> None:
+            f_name = os.path.basename(f)
+            progress.update(task, advance=done, file=f"- [dim]{f_name}[/]")
 
-    def setSpecialChars(self, removeSpecialChars: bool) -> None:
-        self._remove_special_chars = removeSpecialChars
+        files_num = replay(filename, advance)
+        progress.update(task, file="")
+    return files_num
 
-    def setQuiet(self, quiet: bool) -> None:
-        self._quiet = quiet
-        self._update_print()
 
-    def setNoChange(self, noChange: bool) -> None:
-        self._no_change = noChange
+def _watch(cesper: cesp) -> None:
+    action = "Found" if cesper.isNoChange() else "Renamed"
+    total = 0
 
-    def setChange(self, changeOption: ChangeItemMode) -> None:
-        self._change = changeOption
+    def report(renames: int) -> None:
+        nonlocal total
+        total += renames
+        if not cesper.isQuiet():
+            _print_collisions(cesper.getCollisions())
+            console.print(f"{action} {renames} entries")
 
-    def setPath(self, path: str) -> None:
-        self._path = os.path.realpath(path)
+    def watch() -> None:
+        try:
+            cesper.watch(report)
+        except KeyboardInterrupt:
+            pass
+        except CollisionError as e:
+            # the passes before this one are already renamed
+            _print_aborted(e, cesper.isQuiet(), 0 if cesper.isNoChange() else total)
+            raise SystemExit(1)
 
-    # Getters
+    if cesper.isQuiet():
+        watch()
+        return
 
-    @staticmethod
-    def getVersion() -> str:
-        return __version__
+    console = _get_console()
+    console.print(f"Watching [bold]{cesper.getPath()}[/], press Ctrl+C to stop")
+    watch()
+    console.print(f"Stopped watching, {action.lower()} {total} entries")
+    if cesper.isNoChange():
+        console.print("[bold red]No changes were made[/]")
 
-    def getPath(self) -> str:
-        return self._path
 
-    def isRecursive(self) -> bool:
-        return self._recursive
+# time spent waiting on the filesystem vs. cesp's own work
+_filesystem_timers = ("list_dir", "stat", "rename")
+_own_timers = ("convert", "progress", "output")
 
-    def getIgnoredDirs(self) -> listStr:
-        return self._ignored_dirs
 
-    def getIgnoredExtensions(self) -> listStr:
-        return self._ignored_exts
+def _print_stats(report: Dict[str, Any], quiet: bool) -> None:
+    timers = report["timers"]
+    filesystem = sum(timers[t]["total_s"] for t in _filesystem_timers if t in timers)
+    own = sum(timers[t]["total_s"] for t in _own_timers if t in timers)
+    summary = (
+        f"{report['elapsed_s']:.2f} s elapsed, {filesystem:.2f} s in filesystem "
+        f"calls, {own:.2f} s converting names and reporting progress"
+    )
 
-    def whatToChange(self) -> ChangeItemMode:
-        return self._change
+    if quiet:
+        lines = [f"cesp: {summary}"]
+        for name, value in sorted(report["counters"].items()):
+            lines.append(f"cesp: {name} {value}")
+        for name, t in timers.items():
+            lines.append(
+                f"cesp: {name} count {t['count']} total {t['total_s']:.3f} s "
+                f"p50 {t['p50_ms']:.3f} ms p99 {t['p99_ms']:.3f} ms"
+            )
+        print("\n".join(lines), file=sys.stderr)
+        return
 
-    def isNoChange(self) -> bool:
-        return self._no_change
+    from rich.table import Table
+
+    console = _get_console()
+    table = Table("Timer", "Count", "Total s", "Mean ms", "p50 ms", "p99 ms", "Max ms")
+    for name, t in timers.items():
+        table.add_row(
+            f"[cyan]{name}[/]" if name in _filesystem_timers else name,
+            f"{t['count']:,}",
+            f"{t['total_s']:.3f}",
+            f"{t['mean_ms']:.3f}",
+            f"{t['p50_ms']:.3f}",
+            f"{t['p99_ms']:.3f}",
+            f"{t['max_ms']:.3f}",
+        )
+    console.print(table)
+    counters = report["counters"]
+    console.print(
+        ", ".join(f"{name} [bold]{counters[name]:,}[/]" for name in sorted(counters))
+    )
+    console.print(summary)
 
 
 def main() -> None:
+    import argparse
 
     start_time = time.time()
 
@@ -392,7 +3724,17 @@ def main() -> None:
         description=desc, formatter_class=argparse.RawTextHelpFormatter
     )
 
-    parser.add_argument("path", nargs="?", default=os.getcwd(), help="path")
+    parser.add_argument(
+        "path", nargs="*", help="paths to process (default: current directory)"
+    )
+
+    parser.add_argument(
+        "--roots-file",
+        dest="roots_file",
+        default=None,
+        metavar="FILE",
+        help="also process the paths listed in FILE, one per line (- for stdin)",
+    )
 
     parser.add_argument(
         "-c",
@@ -404,10 +3746,76 @@ def main() -> None:
         choices=choices_keys,
     )
 
+    parser.add_argument(
+        "--on-collision",
+        dest="on_collision",
+        default="skip",
+        help="what to do when the new name is already taken",
+        choices=[p.name for p in CollisionPolicy],
+    )
+
     parser.add_argument(
         "-r", dest="recursive", help="recursive action", action="store_true"
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="number of threads used to scan directories",
+    )
+
+    parser.add_argument(
+        "-P",
+        "--processes",
+        dest="processes",
+        type=int,
+        default=1,
+        help="number of processes used to convert names",
+    )
+
+    parser.add_argument(
+        "--low-memory",
+        dest="low_memory",
+        help="rename while walking, holding one directory branch at a time",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--survey",
+        dest="survey",
+        help="estimate how many names would be renamed, and by which rules,\n"
+        "from random samples of the tree, without renaming anything",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--probes",
+        dest="probes",
+        type=int,
+        default=SURVEY_PROBES,
+        metavar="N",
+        help="with --survey, how many random paths down the tree to sample",
+    )
+
+    parser.add_argument(
+        "--seed",
+        dest="seed",
+        type=int,
+        default=None,
+        help="with --survey, seed of the random samples",
+    )
+
+    parser.add_argument(
+        "--rate",
+        dest="rate",
+        type=float,
+        default=0.0,
+        help="maximum number of renames per second (default: no limit)",
+    )
+
     parser.add_argument(
         "-d", "--dots", dest="dots", help="replace dots", action="store_true"
     )
@@ -420,6 +3828,14 @@ def main() -> None:
         "-b", dest="brackets", help="remove brackets", action="store_true"
     )
 
+    parser.add_argument(
+        "--rules",
+        dest="rules",
+        default=None,
+        metavar="FILE",
+        help="JSON file with the characters to convert, see load_rules",
+    )
+
     parser.add_argument(
         "-s",
         "--special-chars",
@@ -446,6 +3862,118 @@ def main() -> None:
         nargs="+",
     )
 
+    parser.add_argument(
+        "--index",
+        dest="index",
+        default=None,
+        help="scan index file, directories unchanged since the last run are skipped",
+    )
+
+    parser.add_argument(
+        "--stdin",
+        dest="stdin",
+        help="rename the paths read from stdin instead of walking the tree,\n"
+        "children must come before their parents (find -depth)",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--archive",
+        dest="archive",
+        nargs=2,
+        default=None,
+        metavar=("ARCHIVE", "OUTPUT"),
+        help="write a copy of the zip, tar or 7z ARCHIVE to OUTPUT with its\n"
+        "members renamed, without extracting it",
+    )
+
+    parser.add_argument(
+        "-0",
+        "--null",
+        dest="null",
+        help="with --stdin, paths are separated by NUL instead of newlines",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--plan-out",
+        dest="plan_out",
+        default=None,
+        metavar="FILE",
+        help="write the renames to FILE (- for stdout) instead of performing them",
+    )
+
+    parser.add_argument(
+        "--plan-in",
+        dest="plan_in",
+        default=None,
+        metavar="FILE",
+        help="perform the renames listed in FILE, without walking the tree",
+    )
+
+    parser.add_argument(
+        "--journal",
+        dest="journal",
+        default=None,
+        metavar="FILE",
+        help="record the renames in FILE, to --resume or --undo them later",
+    )
+
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        default=None,
+        metavar="FILE",
+        help="finish the renames of an interrupted run recorded in FILE",
+    )
+
+    parser.add_argument(
+        "--undo",
+        dest="undo",
+        default=None,
+        metavar="FILE",
+        help="revert the renames recorded in FILE",
+    )
+
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        help="keep running and rename new entries as they show up",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--watch-backend",
+        dest="watch_backend",
+        default="auto",
+        help="how --watch finds changes",
+        choices=[b.name for b in WatchBackend],
+    )
+
+    parser.add_argument(
+        "--debounce",
+        dest="debounce",
+        type=float,
+        default=WATCH_DEBOUNCE,
+        metavar="SECONDS",
+        help="with --watch, how long changes must settle before renaming",
+    )
+
+    parser.add_argument(
+        "--stats",
+        dest="stats",
+        help="print counters and timings of the run",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--stats-json",
+        dest="stats_json",
+        default=None,
+        metavar="FILE",
+        help="write counters and timings of the run to FILE as JSON",
+    )
+
     parser.add_argument(
         "-q", "--quiet", dest="quiet", help="no verbosity", action="store_true"
     )
@@ -471,81 +3999,126 @@ def main() -> None:
 
     args = parser.parse_args()
 
+    roots = list(args.path)
+    if args.roots_file is not None:
+        try:
+            roots += _read_roots(args.roots_file)
+        except OSError as e:
+            parser.error(f"could not read --roots-file: {e}")
+    if not roots:
+        roots = [os.getcwd()]
+    if len(roots) > 1:
+        single_root_options = {
+            "--plan-out": args.plan_out,
+            "--plan-in": args.plan_in,
+            "--journal": args.journal,
+            "--resume": args.resume,
+            "--undo": args.undo,
+            "--watch": args.watch,
+            "--survey": args.survey,
+        }
+        for option, value in single_root_options.items():
+            if value:
+                parser.error(f"{option} can only be used with a single path")
+
+    if args.stdin and (args.path or args.roots_file is not None):
+        parser.error("--stdin can not be used with paths or --roots-file")
+    if args.archive is not None and (args.path or args.roots_file is not None):
+        parser.error("--archive can not be used with paths or --roots-file")
+    if args.plan_out == "-":
+        # the plan is the only output
+        args.quiet = True
+    if args.probes < 1:
+        parser.error("--probes must be at least 1")
+    if args.low_memory and args.on_collision == CollisionPolicy.abort.name:
+        # renames are done before the rest of the tree is even listed
+        parser.error("--on-collision abort can not be used with --low-memory")
+
     FORMAT = "%(message)s"
-    logging.basicConfig(
-        level=args.loglevel,
-        format=FORMAT,
-        datefmt="[%X]",
-        handlers=[RichHandler(console=console)],
-    )
+    if args.quiet:
+        logging.basicConfig(level=args.loglevel, format=FORMAT, datefmt="[%X]")
+    else:
+        from rich.logging import RichHandler
+
+        logging.basicConfig(
+            level=args.loglevel,
+            format=FORMAT,
+            datefmt="[%X]",
+            handlers=[RichHandler(console=_get_console())],
+        )
 
     root_logger.debug("Args passed: {}".format(args))
 
     cesper: cesp = cesp()
     root_logger.debug("Passings args to cesper object")
     cesper.setRecursive(args.recursive)
+    cesper.setJobs(args.jobs)
+    cesper.setProcesses(args.processes)
+    cesper.setLowMemory(args.low_memory)
+    cesper.setRenameRate(args.rate)
+    cesper.setIndexFile(args.index)
+    cesper.setJournal(args.journal)
     cesper.setIgnoredDirs(args.ignoredirs)
     cesper.setIgnoredExts(args.ignoreexts)
     cesper.setUTF(args.UTF)
+    try:
+        cesper.setRuleFile(args.rules)
+    except (OSError, ValueError) as e:
+        parser.error(f"could not load --rules: {e}")
     cesper.setDots(args.dots)
     cesper.setBrackets(args.brackets)
     cesper.setQuiet(args.quiet)
+    cesper.setStats(args.stats or args.stats_json is not None)
     cesper.setNoChange(args.nochange)
     cesper.setChange(list_of_choices[args.change[0]])
     cesper.setSpecialChars(args.special_chars)
-    cesper.setPath(args.path)
-
-    root_logger.debug("Calling cesper.fetch()")
-
-    og_files: listStr = []
-    ren_files: listStr = []
-
-    fetching_message = "Fetching files..."
-    with Progress(
-        SpinnerColumn(),
-        fetching_message,
-        "[dim]{task.fields[extra]}[/]",
-        transient=True,
-    ) as progress:
-        task = progress.add_task(description="", start=False, extra="")
-        og_files, ren_files = cesper.fetch(
-            lambda f, total: progress.update(task, extra=f"found {total} - latest: {f}")
-        )
-
-    files_num = len(og_files)
-
-    console.print(f"[bold green]OK![/] {fetching_message}")
-    console.print(f"Found {files_num} files")
-
-    if files_num > 0:
+    cesper.setCollisionPolicy(CollisionPolicy[args.on_collision])
+    cesper.setWatchBackend(WatchBackend[args.watch_backend])
+    cesper.setWatchDebounce(args.debounce)
+    cesper.setPath(roots[0])
 
-        if args.nochange:
-            cesper.rename_list(og_files, ren_files)
-            console.print("[bold red]No changes were made[/]")
+    try:
+        if len(roots) > 1:
+            if not _batch(cesper, roots):
+                raise SystemExit(1)
+        elif args.resume is not None:
+            _replay_journal(cesper, args.resume, undo=False)
+        elif args.undo is not None:
+            _replay_journal(cesper, args.undo, undo=True)
+        elif args.plan_in is not None:
+            _apply_plan(cesper, args.plan_in)
+        elif args.archive is not None:
+            _rename_archive(cesper, *args.archive)
+        elif args.survey:
+            _survey(cesper, args.probes, args.seed)
+        elif args.stdin:
+            _filter_paths(cesper, b"\0" if args.null else b"\n", args.plan_out)
+        elif args.plan_out is not None:
+            _write_plan(cesper, args.plan_out)
+        elif args.watch:
+            _watch(cesper)
+        elif args.low_memory:
+            _rename_tree(cesper)
         else:
-            with Progress(
-                "[progress.description]{task.description}",
-                BarColumn(),
-                "[progress.percentage]{task.percentage:>3.0f}%",
-                TimeRemainingColumn(),
-                "{task.fields[file]}",
-                console=console,
-            ) as progress:
-                task = progress.add_task(
-                    description="Renaming...", total=files_num, file=""
-                )
-                for f, new_f in zip(og_files, ren_files):
-                    f_name = os.path.basename(f)
-                    progress.update(task, file=f"- [dim]{f_name}[/]")
-                    cesper.rename_item(f, new_f)
-                    time.sleep(RENAME_DELAY)
-                    progress.advance(task, 1)
-                progress.update(task, file="")
+            _fetch_and_rename(cesper)
+    except CollisionError as e:
+        _print_aborted(e, args.quiet)
+        raise SystemExit(1)
+    finally:
+        cesper.close()
+        report = cesper.getStats()
+        if report is not None:
+            if args.stats:
+                _print_stats(report, args.quiet)
+            if args.stats_json is not None:
+                import json
 
-        cesper.return_to_original_path()
+                with open(args.stats_json, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2)
 
-    elapsed_time = time.time() - start_time
-    console.print(f"Finished in {elapsed_time:.2f} seconds")
+    if not args.quiet:
+        elapsed_time = time.time() - start_time
+        _get_console().print(f"Finished in {elapsed_time:.2f} seconds")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import argparse
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable
+
+from rich import print
+from rich.table import Table
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+from bench_convert import make_names  # noqa: E402
+
+import cesp  # noqa: E402
+
+
+def make_archive(filename: str, members: int, size: int) -> None:
+    # members of size bytes, 100 per directory, compressible but not trivially
+    names = make_names(min(members, 10_000))
+    block = os.urandom(size // 4) * 4
+    if filename.endswith(".zip"):
+        with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as z:
+            for i in range(members):
+                z.writestr(f"dir {i // 100}/{i} {names[i % len(names)]}", block)
+        return
+    with tarfile.open(filename, "w:gz") as t:
+        for i in range(members):
+            info = tarfile.TarInfo(f"dir {i // 100}/{i} {names[i % len(names)]}")
+            info.size = len(block)
+            with tempfile.TemporaryFile() as data:
+                data.write(block)
+                data.seek(0)
+                t.addfile(info, data)
+
+
+def new_cesper() -> cesp.cesp:
+    cesper = cesp.cesp()
+    cesper.setRecursive(True)
+    cesper.setChange(cesp.ChangeItemMode.all)
+    cesper.setUTF(True)
+    cesper.setDots(True)
+    cesper.setBrackets(True)
+    cesper.setSpecialChars(True)
+    cesper.setNoChange(False)
+    cesper.setQuiet(True)
+    return cesper
+
+
+def repack(filename: str, output: str, tmp: str) -> None:
+    # what we do today: extract, rename on disk and pack again
+    tree = os.path.join(tmp, "tree")
+    shutil.unpack_archive(filename, tree)
+    cesper = new_cesper()
+    cesper.setPath(tree)
+    cesper.rename_list(*cesper.fetch())
+    if output.endswith(".zip"):
+        shutil.make_archive(output[: -len(".zip")], "zip", tree)
+    else:
+        shutil.make_archive(output[: -len(".tar.gz")], "gztar", tree)
+    shutil.rmtree(tree)
+
+
+def timed(run: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="rename_archive vs extracting, renaming and repacking"
+    )
+    parser.add_argument("--members", type=int, default=5_000)
+    parser.add_argument("--size", type=int, default=64 << 10, help="bytes per member")
+    args = parser.parse_args()
+
+    table = Table("archive", "size", "repack", "rename_archive", "speedup")
+    with tempfile.TemporaryDirectory() as tmp:
+        for suffix in (".zip", ".tar.gz"):
+            source = os.path.join(tmp, "source" + suffix)
+            make_archive(source, args.members, args.size)
+            output = os.path.join(tmp, "output" + suffix)
+            old = timed(lambda: repack(source, output, tmp))
+            os.remove(output)
+            new = timed(lambda: new_cesper().rename_archive(source, output))
+            table.add_row(
+                suffix,
+                f"{os.path.getsize(source) / 1e6:,.1f} MB",
+                f"{old:.2f} s",
+                f"{new:.2f} s",
+                f"{old / new:.1f}x",
+            )
+    print(f"{args.members:,} members of {args.size:,} bytes")
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from rich import print
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+import cesp  # noqa: E402
+
+ascii_words = ["track", "cover", "final", "report", "IMG", "backup", "v2", "copy"]
+accented_words = ["coração", "ação", "MELÃO", "café", "pão", "Über", "então"]
+special_words = ["a&b", "50%", "#1", "what?", "[HD]", "(1)", "{x}", "x,y", "a.b.c"]
+extensions = [".txt", ".mp3", ".jpg", ".mkv", ".tar.gz", ""]
+
+
+def make_names(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    words = ascii_words + accented_words + special_words
+    names = []
+    for _ in range(count):
+        n_words = rng.randint(1, 5)
+        sep = rng.choice([" ", "  ", "_", " - ", "."])
+        name = sep.join(rng.choice(words) for _ in range(n_words))
+        names.append(name + rng.choice(extensions))
+    return names
+
+
+def bench(convert: Callable[[str], str], names: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name in names:
+            convert(name)
+        best = min(best, time.perf_counter() - start)
+    return len(names) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="name conversion micro-benchmark")
+    parser.add_argument("-n", dest="count", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    names = make_names(args.count)
+
+    cesper = cesp.cesp()
+    cesper.setUTF(True)
+    cesper.setDots(True)
+    cesper.setBrackets(True)
+    cesper.setSpecialChars(True)
+
+    for name in names:
+        assert cesper._get_converted_name(name) == (
+            cesper._get_converted_name_stepwise(name)
+        )
+
+    stepwise = bench(cesper._get_converted_name_stepwise, names, args.repeat)
+    cesper.setNameCacheSize(0)
+    compiled = bench(cesper._get_converted_name, names, args.repeat)
+    cesper.setNameCacheSize(cesp.NAME_CACHE_SIZE)
+    cached = bench(cesper._get_converted_name, names, args.repeat)
+
+    print(f"names: {len(names)} (-dubs), {len(set(names))} unique")
+    print(f"stepwise pipeline: {stepwise:12,.0f} names/s")
+    print(f"compiled converter: {compiled:11,.0f} names/s")
+    print(f"compiled + cache: {cached:13,.0f} names/s")
+    print(f"speedup: [bold green]{compiled / stepwise:.2f}x[/] (uncached)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from rich import print
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+import cesp  # noqa: E402
+
+
+class LatencyCesp(cesp.cesp):
+    # simulates a network filesystem where every directory listing is slow
+    def __init__(self, latency: float) -> None:
+        super().__init__()
+        self.latency = latency
+
+    def _scan_dir(self, path: str) -> cesp._DirScan:
+        time.sleep(self.latency)
+        return super()._scan_dir(path)
+
+
+def make_tree(root: Path, depth: int, width: int, files: int) -> int:
+    all_dirs: List[Path] = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(width):
+                d = parent / f"dir {i}"
+                d.mkdir()
+                next_level.append(d)
+        level = next_level
+        all_dirs += level
+    for d in all_dirs:
+        for i in range(files):
+            (d / f"file {i}.txt").touch()
+    return len(all_dirs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="parallel fetch benchmark")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--width", type=int, default=6)
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="seconds per directory listing"
+    )
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        n_dirs = make_tree(Path(tmp), args.depth, args.width, args.files)
+        print(
+            f"tree: {n_dirs} dirs, depth {args.depth}, width {args.width}, "
+            f"latency {args.latency * 1000:.1f} ms/dir"
+        )
+
+        baseline = 0.0
+        expected = None
+        for jobs in args.jobs:
+            cesper = LatencyCesp(args.latency)
+            cesper.setPath(tmp)
+            cesper.setRecursive(True)
+            cesper.setChange(cesp.ChangeItemMode.all)
+            cesper.setJobs(jobs)
+
+            start = time.perf_counter()
+            result = cesper.fetch()
+            elapsed = time.perf_counter() - start
+
+            if expected is None:
+                expected = result
+                baseline = elapsed
+            assert result == expected, "parallel scan changed the fetch order"
+
+            print(
+                f"-j {jobs:<3} {elapsed:8.3f} s  {n_dirs / elapsed:10,.0f} dirs/s  "
+                f"speedup {baseline / elapsed:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from rich import print
+from rich.table import Table
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+from bench_convert import make_names  # noqa: E402
+
+import cesp  # noqa: E402
+
+root = os.path.join(os.sep, "bench")
+
+
+def make_fs(entries: int, per_dir: int, latency: float) -> cesp.MemoryFileSystem:
+    # dirs of per_dir files, 10 dirs per parent
+    fs = cesp.MemoryFileSystem(listdir_latency=latency)
+    names = make_names(min(entries, 100_000))
+    for i in range(entries):
+        d = i // per_dir
+        parent = os.path.join(root, f"group {d // 10}", f"dir {d}")
+        fs.add(os.path.join(parent, f"{i} {names[i % len(names)]}"))
+    return fs
+
+
+def new_cesper(fs: cesp.MemoryFileSystem, jobs: int) -> cesp.cesp:
+    cesper = cesp.cesp()
+    cesper.setFileSystem(fs)
+    cesper.setPath(root)
+    cesper.setRecursive(True)
+    cesper.setChange(cesp.ChangeItemMode.all)
+    cesper.setUTF(True)
+    cesper.setDots(True)
+    cesper.setBrackets(True)
+    cesper.setSpecialChars(True)
+    cesper.setNoChange(False)
+    cesper.setQuiet(True)
+    cesper.setJobs(jobs)
+    return cesper
+
+
+def timed(run: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def bench_scale(args: argparse.Namespace) -> None:
+    table = Table("entries", "fetch", "rename_list", "rename_tree --low-memory")
+    for entries in args.entries:
+        fs = make_fs(entries, args.per_dir, 0.0)
+        cesper = new_cesper(fs, 1)
+        fetched: List[List[str]] = []
+        fetch = timed(lambda: fetched.extend(cesper.fetch()))
+        rename = timed(lambda: cesper.rename_list(*fetched))
+
+        fs = make_fs(entries, args.per_dir, 0.0)
+        cesper = new_cesper(fs, 1)
+        cesper.setLowMemory(True)
+        tree = timed(cesper.rename_tree)
+        table.add_row(
+            f"{entries:,}",
+            f"{entries / fetch:,.0f}/s",
+            f"{len(fetched[0]) / rename:,.0f}/s",
+            f"{entries / tree:,.0f}/s",
+        )
+    print(table)
+
+
+def bench_latency(args: argparse.Namespace) -> None:
+    dirs = args.latency_dirs
+    fs = make_fs(dirs * args.per_dir, args.per_dir, args.latency / 1000)
+    table = Table("jobs", "fetch", "vs -j 1")
+    base = 0.0
+    for jobs in args.jobs:
+        cesper = new_cesper(fs, jobs)
+        elapsed = timed(cesper.fetch)
+        cesper.close()
+        base = base or elapsed
+        table.add_row(str(jobs), f"{elapsed:.2f} s", f"{base / elapsed:.1f}x")
+    print(f"{dirs:,} directories, {args.latency} ms per listing")
+    print(table)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="fetch and rename on an in-memory file system"
+    )
+    parser.add_argument("--entries", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--per-dir", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=5.0, help="ms per listing")
+    parser.add_argument("--latency-dirs", type=int, default=500)
+    parser.add_argument("-j", "--jobs", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    bench_scale(args)
+    bench_latency(args)
+
+
+if __name__ == "__main__":
+    main()
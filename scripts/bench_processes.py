@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from rich import print
+from rich.table import Table
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+from bench_convert import make_names  # noqa: E402
+
+import cesp  # noqa: E402
+
+
+def make_scans(names: List[str], per_dir: int) -> List[cesp._DirScan]:
+    return [
+        cesp._DirScan(f"/bench/dir{i}", names[i : i + per_dir], [], [], [])
+        for i in range(0, len(names), per_dir)
+    ]
+
+
+def new_cesper(processes: int) -> cesp.cesp:
+    cesper = cesp.cesp()
+    cesper.setUTF(True)
+    cesper.setDots(True)
+    cesper.setBrackets(True)
+    cesper.setSpecialChars(True)
+    cesper.setNameCacheSize(0)
+    cesper.setProcesses(processes)
+    return cesper
+
+
+def convert_all(
+    processes: int, scans: List[cesp._DirScan], warm: bool
+) -> Tuple[float, int]:
+    # conversion stage of fetch(), listing excluded. A cold run includes
+    # starting the worker processes, as a single cesp run would.
+    cesper = new_cesper(processes)
+    if warm and processes > 1:
+        cesper._get_process_pool().submit(cesp._convert_names, []).result()
+    try:
+        start = time.perf_counter()
+        renames = 0
+        for scan, converted in cesper._convert_in_processes(scans):
+            renames += len(cesper._convert_scan(scan, converted))
+        return time.perf_counter() - start, renames
+    finally:
+        cesper.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="in-process vs process pool name conversion"
+    )
+    parser.add_argument(
+        "--names", type=int, nargs="+", default=[1_000, 10_000, 100_000, 400_000]
+    )
+    parser.add_argument(
+        "-P", dest="processes", type=int, nargs="+", default=[2, os.cpu_count() or 2]
+    )
+    parser.add_argument(
+        "--batch", type=int, nargs="+", default=[512, cesp.PROCESS_BATCH_SIZE, 32768]
+    )
+    parser.add_argument("--per-dir", type=int, default=200)
+    parser.add_argument("--warm", action="store_true", help="exclude pool startup")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    processes = sorted(set(p for p in args.processes if p > 1))
+    table = Table("names", "batch", "in-process", *(f"-P {p}" for p in processes))
+    crossover: Dict[Tuple[int, int], Optional[int]] = {}
+
+    for count in args.names:
+        scans = make_scans(make_names(count), args.per_dir)
+        base, expected = min(
+            convert_all(1, scans, args.warm) for _ in range(args.repeat)
+        )
+        for batch in args.batch:
+            cesp.PROCESS_BATCH_SIZE = batch
+            row = [f"{count:,}", f"{batch:,}", f"{count / base:12,.0f}/s"]
+            for p in processes:
+                if count < batch:
+                    # a single partial batch, converted in-process anyway
+                    row.append("[dim]in-process[/]")
+                    continue
+                elapsed, renames = min(
+                    convert_all(p, scans, args.warm) for _ in range(args.repeat)
+                )
+                assert renames == expected
+                color = "green" if elapsed < base else "red"
+                row.append(f"[{color}]{base / elapsed:5.2f}x[/]")
+                if elapsed < base and crossover.get((p, batch)) is None:
+                    crossover[(p, batch)] = count
+            table.add_row(*row)
+
+    print(f"cpus: {os.cpu_count()}, {args.per_dir} names per directory")
+    print(table)
+    for p in processes:
+        for batch in args.batch:
+            count = crossover.get((p, batch))
+            where = f"from {count:,} names" if count else "never, in this range"
+            print(f"-P {p}, batches of {batch:,}: process pool wins {where}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from rich import print
+from rich.table import Table
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+import cesp  # noqa: E402
+
+Renameat2 = Optional[Callable[[int, bytes, int, bytes, int], int]]
+
+
+def make_tree(root: Path, depth: int, dirs: int, files: int) -> int:
+    # dirs chains of depth directories, files in the deepest one of each
+    for d in range(dirs):
+        leaf = root.joinpath(f"top{d}", *(f"level{i}" for i in range(depth)))
+        leaf.mkdir(parents=True)
+        for f in range(files):
+            (leaf / f"file {f}.txt").touch()
+    return dirs * files
+
+
+def rename_all(root: Path, by_path: bool, renameat2: Renameat2) -> float:
+    load_renameat2 = cesp._load_renameat2
+    supported = cesp._DirFds.supported
+    cesp._DirFds.supported = supported and not by_path
+    cesp._load_renameat2 = lambda: renameat2  # type: ignore
+    try:
+        cesper = cesp.cesp()
+        cesper.setPath(str(root))
+        cesper.setRecursive(True)
+        cesper.setNoChange(False)
+        cesper.setQuiet(True)
+        og, ren = cesper.fetch()
+        start = time.perf_counter()
+        cesper.rename_list(og, ren)
+        return time.perf_counter() - start
+    finally:
+        cesp._load_renameat2 = load_renameat2
+        cesp._DirFds.supported = supported
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="rename_list by path vs relative to directory descriptors"
+    )
+    parser.add_argument("--depth", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--dirs", type=int, default=20)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    renameat2 = cesp._load_renameat2()
+    modes: Dict[str, Callable[[Path], float]] = {
+        "by path": lambda root: rename_all(root, True, None),
+        "dir_fd": lambda root: rename_all(root, False, None),
+    }
+    if renameat2 is not None:
+        modes["renameat2"] = lambda root: rename_all(root, False, renameat2)
+
+    table = Table("depth", "renames", *(f"{mode} renames/s" for mode in modes))
+    with tempfile.TemporaryDirectory() as tmp:
+        for depth in args.depth:
+            row = [str(depth)]
+            for run in modes.values():
+                best = float("inf")
+                for i in range(args.repeat):
+                    root = Path(tmp) / "tree"
+                    renames = make_tree(root, depth, args.dirs, args.files)
+                    best = min(best, run(root))
+                    shutil.rmtree(root)
+                if len(row) == 1:
+                    row.append(f"{renames:,}")
+                row.append(f"{renames / best:,.0f}")
+            table.add_row(*row)
+    if not cesp._DirFds.supported:
+        print("[bold red]no dir_fd support here, every mode renames by path[/]")
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
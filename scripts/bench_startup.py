@@ -0,0 +1,92 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from rich import print
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+
+# modules that must not be loaded by "import cesp" or by a quiet run
+heavy_modules = ["rich", "asyncio", "sqlite3", "concurrent", "argparse", "json"]
+
+
+def python_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # measure with cached bytecode, like an installed cesp
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPATH"] = str(repo_dir)
+    return env
+
+
+def import_time_us(env: Dict[str, str]) -> int:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import cesp"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == "cesp":
+            return int(fields[1])
+    raise RuntimeError("cesp not found in -X importtime output")
+
+
+def quiet_run_s(env: Dict[str, str], path: str) -> float:
+    # the way the cesp:main entry point runs, so the module comes from the
+    # bytecode cache instead of being compiled as __main__ every time
+    code = f"import cesp, sys; sys.argv = ['cesp', '-q', '-n', {path!r}]; cesp.main()"
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def loaded_heavy_modules(env: Dict[str, str]) -> List[str]:
+    code = "import sys, cesp; print(' '.join(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True
+    )
+    loaded = {m.split(".")[0] for m in result.stdout.split()}
+    return [m for m in heavy_modules if m in loaded]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="cesp startup benchmark")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=None,
+        help="exit with an error if the median import time is above this",
+    )
+    args = parser.parse_args()
+
+    env = python_env()
+    import_time_us(env)  # warm up the bytecode cache
+
+    imports = [import_time_us(env) for _ in range(args.repeat)]
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [quiet_run_s(env, tmp) for _ in range(args.repeat)]
+
+    import_ms = statistics.median(imports) / 1000
+    print(f"import cesp (cumulative): {import_ms:8.2f} ms (median of {args.repeat})")
+    print(f"cesp -q -n <empty dir>:   {statistics.median(runs) * 1000:8.2f} ms")
+
+    heavy = loaded_heavy_modules(env)
+    if heavy:
+        print(f"[bold red]imported at startup:[/] {', '.join(heavy)}")
+    if heavy or (args.max_import_ms is not None and import_ms > args.max_import_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
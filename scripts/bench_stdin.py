@@ -0,0 +1,79 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from rich import print
+from rich.table import Table
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+main_py: Path = Path(repo_dir / "cesp.py")
+sys.path.insert(0, str(script_dir))
+
+from bench_convert import make_names  # noqa: E402
+
+
+def write_listing(filename: str, count: int, names: List[str]) -> int:
+    # find -depth -print0 style listing, 100 entries per directory
+    size = 0
+    with open(filename, "wb") as f:
+        for i in range(count):
+            name = names[i % len(names)]
+            path = f"./dir {i // 100 % 1000}/sub dir {i // 100}/{name}"
+            data = os.fsencode(path) + b"\0"
+            f.write(data)
+            size += len(data)
+    return size
+
+
+def run_filter(filename: str) -> Tuple[float, int]:
+    # wall time and peak RSS in KiB of cesp --stdin writing the plan to nowhere
+    before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    start = time.perf_counter()
+    with open(filename, "rb") as stdin:
+        subprocess.run(
+            [sys.executable, str(main_py), "--stdin", "-0", "-q", "-usdb", "-c", "all"]
+            + ["--plan-out", os.devnull],
+            stdin=stdin,
+            check=True,
+        )
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return elapsed, max(before, after)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="cesp --stdin throughput and memory by listing size"
+    )
+    parser.add_argument(
+        "--paths", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+
+    names = make_names(10_000)
+    table = Table("paths", "listing", "paths/s", "MB/s", "peak RSS")
+    with tempfile.TemporaryDirectory() as tmp:
+        listing = os.path.join(tmp, "listing")
+        # ru_maxrss of the children only ever grows, so the smallest run first
+        for count in sorted(args.paths):
+            size = write_listing(listing, count, names)
+            elapsed, rss_kib = run_filter(listing)
+            table.add_row(
+                f"{count:,}",
+                f"{size / 1e6:,.1f} MB",
+                f"{count / elapsed:,.0f}",
+                f"{size / 1e6 / elapsed:,.1f}",
+                f"{rss_kib / 1024:,.1f} MiB",
+            )
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from rich import print
+from rich.table import Table
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+from bench_convert import make_names  # noqa: E402
+
+import cesp  # noqa: E402
+
+root = os.path.join(os.sep, "share")
+
+
+def make_fs(
+    depth: int, fanout: int, files: int, latency: float
+) -> cesp.MemoryFileSystem:
+    # an uneven tree: every directory has 0 to 2 * fanout subdirectories and 0
+    # to 2 * files files
+    rng = random.Random(0)
+    names = make_names(10_000)
+    fs = cesp.MemoryFileSystem(listdir_latency=latency)
+    pending = [(root, 0)]
+    while pending:
+        path, level = pending.pop()
+        fs.add(path, is_dir=True)
+        for i in range(rng.randint(0, 2 * files)):
+            fs.add(os.path.join(path, f"{i} {rng.choice(names)}"))
+        if level < depth:
+            for i in range(rng.randint(0, 2 * fanout)):
+                pending.append((os.path.join(path, f"dir {i}"), level + 1))
+    return fs
+
+
+def new_cesper(fs: cesp.MemoryFileSystem, jobs: int) -> cesp.cesp:
+    cesper = cesp.cesp()
+    cesper.setFileSystem(fs)
+    cesper.setPath(root)
+    cesper.setRecursive(True)
+    cesper.setChange(cesp.ChangeItemMode.all)
+    cesper.setUTF(True)
+    cesper.setDots(True)
+    cesper.setBrackets(True)
+    cesper.setSpecialChars(True)
+    cesper.setQuiet(True)
+    cesper.setJobs(jobs)
+    return cesper
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="survey estimates vs a full fetch on a slow in-memory tree"
+    )
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=2.0, help="ms per listing")
+    parser.add_argument("-j", "--jobs", type=int, default=16)
+    parser.add_argument("--probes", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    fs = make_fs(args.depth, args.fanout, args.files, args.latency / 1000)
+    cesper = new_cesper(fs, args.jobs)
+    start = time.perf_counter()
+    renames = len(cesper.fetch()[0])
+    fetch = time.perf_counter() - start
+    cesper.close()
+
+    table = Table("probes", "dirs listed", "time", "renames", "95% interval", "error")
+    table.add_row("fetch", "all", f"{fetch:.2f} s", f"{renames:,}", "", "")
+    for probes in args.probes:
+        cesper = new_cesper(fs, args.jobs)
+        report = cesper.survey(probes, seed=1)
+        cesper.close()
+        e = report.renames
+        table.add_row(
+            f"{probes:,}",
+            f"{report.dirs_listed:,}",
+            f"{report.seconds:.2f} s",
+            f"{e.value:,.0f}",
+            f"{e.low:,.0f} - {e.high:,.0f}",
+            f"{100 * (e.value - renames) / renames:+.1f}%",
+        )
+    print(f"{args.latency} ms per listing, {args.jobs} threads")
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from rich import print
+
+script_dir: Path = Path(__file__).parent.resolve()
+repo_dir: Path = Path(script_dir / "..").resolve()
+sys.path.insert(0, str(repo_dir))
+
+import cesp  # noqa: E402
+
+words = {
+    "ascii": ["track", "cover", "final", "report", "IMG", "backup", "v2", "copy"],
+    "accented": ["coração", "ação", "MELÃO", "café", "pão", "Über", "então"],
+    "special": ["a&b", "50%", "#1", "what", "[HD]", "(1)", "{x}", "x,y", "a.b"],
+}
+words["mixed"] = words["ascii"] + words["accented"] + words["special"]
+extensions = [".txt", ".mp3", ".jpg", ".mkv", ".log"]
+ignored_exts = ["log"]
+
+
+def make_name(rng: random.Random, kind: str, i: int) -> str:
+    parts = [rng.choice(words[kind]) for _ in range(rng.randint(1, 4))]
+    return " ".join(parts) + f" {i}"
+
+
+def make_tree(root: Path, files: int, depth: int, width: int, kind: str) -> int:
+    rng = random.Random(0)
+    dirs: List[Path] = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(width):
+                d = parent / make_name(rng, kind, i)
+                d.mkdir()
+                next_level.append(d)
+        level = next_level
+        dirs += level
+    for i in range(files):
+        name = make_name(rng, kind, i) + rng.choice(extensions)
+        (dirs[i % len(dirs)] / name).touch()
+    return files + len(dirs) - 1
+
+
+def new_cesper(path: Path, recursive: bool, ignore: bool) -> cesp.cesp:
+    cesper = cesp.cesp()
+    cesper.setPath(str(path))
+    cesper.setRecursive(recursive)
+    cesper.setChange(cesp.ChangeItemMode.all)
+    cesper.setUTF(True)
+    cesper.setDots(True)
+    cesper.setBrackets(True)
+    cesper.setSpecialChars(True)
+    cesper.setQuiet(True)
+    if ignore:
+        cesper.setIgnoredDirs(ignored_top_dirs(path))
+        cesper.setIgnoredExts(list(ignored_exts))
+    return cesper
+
+
+def ignored_top_dirs(path: Path) -> List[str]:
+    # a third of the top level directories
+    top_dirs = sorted(p.name for p in path.iterdir() if p.is_dir())
+    return top_dirs[::3]
+
+
+def best_of(repeat: int, run: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_conversion(args: argparse.Namespace) -> Dict[str, float]:
+    rng = random.Random(1)
+    names = [make_name(rng, args.names, i) + ".txt" for i in range(args.files)]
+    cesper = new_cesper(Path.cwd(), False, False)
+    cesper.setNameCacheSize(0)
+    convert = cesper._get_converted_name
+    elapsed = best_of(args.repeat, lambda: [convert(n) for n in names])
+    return {"convert names/s": len(names) / elapsed}
+
+
+def bench_fetch(args: argparse.Namespace, tree: Path, entries: int) -> Dict[str, float]:
+    results = {}
+    top_entries = sum(1 for _ in tree.iterdir())
+    # the ignored directories are listed in their parent but not walked
+    pruned = sum(sum(1 for _ in (tree / d).rglob("*")) for d in ignored_top_dirs(tree))
+    for recursive in (False, True):
+        for ignore in (False, True):
+            cesper = new_cesper(tree, recursive, ignore)
+            elapsed = best_of(args.repeat, cesper.fetch)
+            seen = top_entries
+            if recursive:
+                seen = entries - pruned if ignore else entries
+            label = "fetch{}{} entries/s".format(
+                " -r" if recursive else "", " +ignore" if ignore else ""
+            )
+            results[label] = seen / elapsed
+    return results
+
+
+def bench_rename(args: argparse.Namespace, tmp: Path) -> Dict[str, float]:
+    best = float("inf")
+    renamed = 0
+    for i in range(args.repeat):
+        tree = tmp / f"rename{i}"
+        tree.mkdir()
+        make_tree(tree, args.files, args.depth, args.width, args.names)
+        cesper = new_cesper(tree, True, False)
+        cesper.setNoChange(False)
+        cesper.setJobs(args.jobs)
+        og, ren = cesper.fetch()
+        start = time.perf_counter()
+        cesper.rename_list(og, ren)
+        best = min(best, time.perf_counter() - start)
+        renamed = len(og)
+        shutil.rmtree(tree)
+    return {"rename_list renames/s": renamed / best}
+
+
+def compare(results: Dict[str, float], baseline_file: str) -> None:
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"\ncompared with [bold]{baseline_file}[/]")
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        ratio = value / baseline[name]
+        color = "green" if ratio >= 1.0 else "red"
+        print(f"{name:<28} [{color}]{ratio:6.2f}x[/]")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="benchmarks for name conversion, fetch() and rename_list()"
+    )
+    parser.add_argument("--files", type=int, default=20_000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--width", type=int, default=5)
+    parser.add_argument("--names", choices=sorted(words), default="mixed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        tree = tmp / "tree"
+        tree.mkdir()
+        entries = make_tree(tree, args.files, args.depth, args.width, args.names)
+        print(
+            f"tree: {entries} entries, depth {args.depth}, width {args.width}, "
+            f"{args.names} names"
+        )
+
+        results.update(bench_conversion(args))
+        results.update(bench_fetch(args, tree, entries))
+        results.update(bench_rename(args, tmp))
+
+    for name, value in results.items():
+        print(f"{name:<28} {value:14,.0f}")
+
+    if args.out:
+        report = {
+            "cesp": cesp.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": vars(args),
+            "results": results,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,14 @@
+import asyncio
+import io
 import os
 import shutil
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
 import py7zr
 import pytest
@@ -175,3 +183,1298 @@ def test_actual_rename(cesper_dubs: cesp.cesp) -> None:
     assert Path(Path(test_folder) / "special_chars" / "asd_adj.txt").is_file()
     assert Path(Path(test_folder) / "id" / "should be ignored.txt").is_file()
     assert Path(Path(test_folder) / "asd_asd_asd" / "file_with_spaces.txt").is_file()
+
+
+_tricky_names = [
+    "",
+    "_",
+    " ",
+    "__a__",
+    "a_.b",
+    "'.txt",
+    "..hidden",
+    "...",
+    "a...b..c.txt",
+    "x, y, z.tar.gz",
+    " _ leading and trailing _ ",
+    "tab\tand\nnewline .txt",
+    "ÇÃO (1) [2] {3}.mkv",
+    "&&&.txt",
+    "°º ª ~^´ ¨ §.doc",
+    "coração de  melão.mp3",
+    "with^special&chars?.mkv",
+    "a _ . _ b",
+    "no_changes_needed.txt",
+]
+
+
+@pytest.mark.parametrize("flags", range(16))
+def test_compiled_converter_matches_stepwise(flags: int) -> None:
+    cesper = cesp.cesp()
+    cesper.setUTF(bool(flags & 1))
+    cesper.setDots(bool(flags & 2))
+    cesper.setBrackets(bool(flags & 4))
+    cesper.setSpecialChars(bool(flags & 8))
+
+    for name in _tricky_names:
+        assert cesper._get_converted_name(name) == cesper._get_converted_name_stepwise(
+            name
+        )
+
+
+def _make_tree(root: Path, files: List[str]) -> None:
+    for f in files:
+        path = root / f
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+
+
+@pytest.fixture
+def dirty_tree(tmp_path: Path) -> Path:
+    _make_tree(
+        tmp_path,
+        [
+            "a b/c d/e f.txt",
+            "a b/c d/ok.txt",
+            "a b/g h.txt",
+            "x y.txt",
+            "clean/also clean?.txt",
+            ".hidden dir/not me.txt",
+        ],
+    )
+    return tmp_path
+
+
+def test_fetch_does_not_change_cwd(cesper_dubs: cesp.cesp, dirty_tree: Path) -> None:
+    cwd = os.getcwd()
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    og, ren = cesper_dubs.fetch()
+    assert os.getcwd() == cwd
+    assert all(os.path.isabs(f) for f in og + ren)
+    # hidden names are kept, but not what is inside hidden directories
+    assert str(dirty_tree / ".hidden dir") not in og
+    assert str(dirty_tree / ".hidden dir" / "not me.txt") in og
+    assert len(og) == 7
+
+
+def test_iter_fetch_yields_children_before_parents(
+    cesper_dubs: cesp.cesp, dirty_tree: Path
+) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    og, ren = cesper_dubs.fetch()
+
+    pairs = list(cesper_dubs.iter_fetch())
+    assert sorted(pairs) == sorted(zip(og, ren))
+    for i, (f, _) in enumerate(pairs):
+        assert not any(p.startswith(f + os.sep) for p, _ in pairs[i + 1 :])
+
+
+@pytest.mark.parametrize("jobs", [2, 8])
+def test_parallel_fetch_keeps_order(
+    jobs: int, cesper_dubs: cesp.cesp, dirty_tree: Path
+) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    expected = cesper_dubs.fetch()
+    expected_lazy = list(cesper_dubs.iter_fetch())
+
+    cesper_dubs.setJobs(jobs)
+    assert cesper_dubs.fetch() == expected
+    assert list(cesper_dubs.iter_fetch()) == expected_lazy
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_rename_list_renames_children_first(
+    jobs: int, cesper_dubs: cesp.cesp, dirty_tree: Path
+) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setJobs(jobs)
+    og, ren = cesper_dubs.fetch()
+
+    reported: List[int] = []
+    cesper_dubs.rename_list(og, ren, lambda done, f: reported.append(done))
+
+    assert sum(reported) == len(og)
+    assert (dirty_tree / "a_b" / "c_d" / "e_f.txt").is_file()
+    assert (dirty_tree / "a_b" / "g_h.txt").is_file()
+    assert (dirty_tree / "clean" / "also_clean.txt").is_file()
+    assert cesper_dubs.fetch() == ([], [])
+
+
+def test_rename_rate_limit(cesper_dubs: cesp.cesp, dirty_tree: Path) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setRenameRate(50)
+    og, ren = cesper_dubs.fetch()
+
+    start = time.monotonic()
+    cesper_dubs.rename_list(og, ren)
+    assert time.monotonic() - start >= (len(og) - 1) / 50
+
+
+def test_scan_index_skips_unchanged_dirs(
+    cesper_dubs: cesp.cesp, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    tree = tmp_path / "tree"
+    _make_tree(tree, ["a/clean.txt", "a/b/clean.txt", "c/clean.txt", "dirty dir/x.txt"])
+    an_hour_ago = time.time() - 3600
+    for d in [tree, *tree.rglob("*")]:
+        os.utime(d, (an_hour_ago, an_hour_ago))
+    cesper_dubs.setPath(str(tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.files)
+    cesper_dubs.setIndexFile(str(tmp_path / "index.db"))
+
+    listed: List[str] = []
+    scandir = os.scandir
+
+    def counting_scandir(path: str) -> "os._ScandirIterator[str]":
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(cesp.os, "scandir", counting_scandir)
+
+    assert cesper_dubs.fetch() == ([], [])
+    assert len(listed) == 5
+
+    listed.clear()
+    assert cesper_dubs.fetch() == ([], [])
+    assert listed == []
+
+    (tree / "a" / "b" / "new file.txt").touch()
+    og, _ = cesper_dubs.fetch()
+    assert og == [str(tree / "a" / "b" / "new file.txt")]
+    assert listed == [str(tree / "a" / "b")]
+
+    # a different option set must not reuse the index
+    listed.clear()
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    og, _ = cesper_dubs.fetch()
+    assert len(og) == 2
+    assert len(listed) == 5
+
+
+def test_scan_index_is_flushed_in_batches(
+    cesper_dubs: cesp.cesp, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(cesp, "INDEX_FLUSH_EVERY", 2)
+    filename = str(tmp_path / "index.db")
+    stat = (1, 2, 3)
+    index = cesp._ScanIndex(filename, "key")
+    for i in range(5):
+        index.record("/dir_{}".format(i), stat, ["sub"])
+        assert len(index._new) < 2
+    # flushed rows are there for anyone, the last one only after save
+    other = cesp._ScanIndex(filename, "key")
+    assert other.lookup("/dir_3", stat) == ["sub"]
+    assert other.lookup("/dir_4", stat) is None
+    assert index.save() == 5
+    assert other.lookup("/dir_4", stat) == ["sub"]
+    assert other.lookup("/dir_4", (1, 2, 4)) is None
+    assert cesp._ScanIndex(filename, "other key").lookup("/dir_4", stat) is None
+    index.close()
+    other.close()
+
+    # looked up and recorded by the scan threads
+    tree = tmp_path / "tree"
+    _make_tree(tree, ["d{}/e{}/clean.txt".format(i, i) for i in range(10)])
+    an_hour_ago = time.time() - 3600
+    for d in [tree, *tree.rglob("*")]:
+        os.utime(d, (an_hour_ago, an_hour_ago))
+    cesper_dubs.setPath(str(tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setJobs(4)
+    cesper_dubs.setIndexFile(filename)
+    assert cesper_dubs.fetch() == ([], [])
+    monkeypatch.setattr(cesp.os, "scandir", None)
+    assert cesper_dubs.fetch() == ([], [])
+
+
+def test_name_cache_is_reset_by_setters(cesper_dubs: cesp.cesp) -> None:
+    assert cesper_dubs._get_converted_name("a b.txt") == "a_b.txt"
+    assert cesper_dubs._get_converted_name("a b.txt") == "a_b.txt"
+    converter = cesper_dubs._get_converter()
+    assert converter.cache_info() == (1, 1, 1)
+
+    cesper_dubs.setDots(False)
+    assert cesper_dubs._get_converter() is not converter
+    assert cesper_dubs._get_converter().cache_info() == (0, 0, 0)
+    assert cesper_dubs._get_converted_name("a.b c.txt") == "a.b_c.txt"
+
+    cesper_dubs.setNameCacheSize(0)
+    assert cesper_dubs._get_converter().cache_info() is None
+
+
+def test_ignored_dirs_are_pruned_by_path_component(
+    cesper_dubs: cesp.cesp, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _make_tree(
+        tmp_path,
+        ["foo/a b.txt", "foo/deep/a b.txt", "foobar/a b.txt", "x/a b.mkv", "x/a b.txt"],
+    )
+    cesper_dubs.setPath(str(tmp_path))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setIgnoredDirs(["foo"])
+    cesper_dubs.setIgnoredExts(["mkv"])
+
+    listed: List[str] = []
+    scandir = os.scandir
+
+    def counting_scandir(path: str) -> "os._ScandirIterator[str]":
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(cesp.os, "scandir", counting_scandir)
+
+    og, _ = cesper_dubs.fetch()
+    assert sorted(og) == [
+        str(tmp_path / "foobar" / "a b.txt"),
+        str(tmp_path / "x" / "a b.txt"),
+    ]
+    assert str(tmp_path / "foo") not in listed
+
+    cesper_dubs.setIgnoredDirs([str(tmp_path / "foo")])
+    cesper_dubs.setPath(str(tmp_path / "foo" / "deep"))
+    assert cesper_dubs.fetch() == ([], [])
+
+
+def test_plan_round_trip(cesper_dubs: cesp.cesp, dirty_tree: Path) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setQuiet(True)
+    plan = str(dirty_tree / ".plan")
+
+    expected = list(cesper_dubs.iter_fetch())
+    assert cesper_dubs.write_plan(plan, cesper_dubs.iter_fetch()) == len(expected)
+    assert list(cesper_dubs.read_plan(plan)) == expected
+
+    cesper_dubs.setNoChange(False)
+    assert cesper_dubs.rename_iter(cesper_dubs.read_plan(plan)) == len(expected)
+    assert (dirty_tree / "a_b" / "c_d" / "e_f.txt").is_file()
+    assert cesper_dubs.fetch() == ([], [])
+
+
+def test_read_plan_rejects_other_files(cesper: cesp.cesp, tmp_path: Path) -> None:
+    not_a_plan = tmp_path / "plan.txt"
+    not_a_plan.write_text("a b.txt\n")
+    with pytest.raises(ValueError):
+        list(cesper.read_plan(str(not_a_plan)))
+
+
+@pytest.mark.parametrize("separator", [b"\n", b"\0"])
+def test_read_paths(
+    separator: bytes, cesper: cesp.cesp, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(cesp, "STDIN_CHUNK_SIZE", 3)
+    paths = [b"a b/c d.txt", b"a b", b"", b"x\xffy"]
+    stream = io.BytesIO(separator.join(paths) + separator)
+
+    assert list(cesper.read_paths(stream, separator)) == [
+        "a b/c d.txt",
+        "a b",
+        os.fsdecode(b"x\xffy"),
+    ]
+
+
+def test_convert_paths(cesper_dubs: cesp.cesp, dirty_tree: Path) -> None:
+    cesper_dubs.setIgnoredExts(["log"])
+    cesper_dubs.setIgnoredDirs([str(dirty_tree / "clean")])
+    (dirty_tree / "a b" / "p q.log").touch()
+    paths = [str(p) for p in sorted(dirty_tree.rglob("*"), reverse=True)]
+
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    pairs = list(cesper_dubs.convert_paths(paths + [str(dirty_tree / "a b") + "/"]))
+    # only hidden names are left alone, the paths are not walked
+    assert [os.path.relpath(f, dirty_tree) for f, _ in pairs] == [
+        "x y.txt",
+        os.path.join("a b", "g h.txt"),
+        os.path.join("a b", "c d", "e f.txt"),
+        os.path.join("a b", "c d"),
+        "a b",
+        os.path.join(".hidden dir", "not me.txt"),
+        "a b",
+    ]
+    assert pairs[-1][1] == str(dirty_tree / "a_b")
+
+    cesper_dubs.setChange(cesp.ChangeItemMode.dirs)
+    assert len(list(cesper_dubs.convert_paths(paths))) == 2
+
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.files)
+    assert cesper_dubs.rename_iter(cesper_dubs.convert_paths(paths)) == 4
+    assert (dirty_tree / "a b" / "c d" / "e_f.txt").is_file()
+
+
+def test_stdin_filter_writes_plan_to_stdout(dirty_tree: Path) -> None:
+    listing = b"\0".join(
+        os.fsencode(p) for p in ["./a b/c d", "./a b/g h.txt", "./ok.txt", "./x y"]
+    )
+    result = subprocess.run(
+        [sys.executable, cesp.__file__, "--stdin", "-0", "-c", "all"]
+        + ["--plan-out", "-"],
+        cwd=str(dirty_tree),
+        input=listing,
+        capture_output=True,
+        check=True,
+    )
+    assert result.stdout.decode().splitlines() == [
+        '["cesp-plan", 1]',
+        '["./a b/c d", "./a b/c_d"]',
+        '["./a b/g h.txt", "./a b/g_h.txt"]',
+        '["./x y", "./x_y"]',
+    ]
+
+
+@pytest.mark.parametrize("renameat2", [True, False])
+def test_renames_never_replace_existing_entries(
+    renameat2: bool,
+    cesper_dubs: cesp.cesp,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    if not renameat2:
+        monkeypatch.setattr(cesp, "_load_renameat2", lambda: None)
+    _make_tree(tmp_path, ["a b/c d.txt", "a b/e f.txt", "x y/z.txt", "x_y/keep.txt"])
+    # "x y" collides with "x_y" and is left out by plan
+    cesper_dubs.setPath(str(tmp_path))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    entries = list(cesper_dubs.plan())
+    # taken after planning, like another process would
+    (tmp_path / "a b" / "e_f.txt").write_text("theirs")
+
+    statuses = {
+        os.path.relpath(r.entry.original, tmp_path): r.status
+        for r in cesper_dubs.apply(entries)
+    }
+    assert statuses == {
+        os.path.join("a b", "c d.txt"): cesp.RenameStatus.renamed,
+        os.path.join("a b", "e f.txt"): cesp.RenameStatus.exists,
+        "a b": cesp.RenameStatus.renamed,
+    }
+    assert (tmp_path / "a_b" / "c_d.txt").is_file()
+    assert (tmp_path / "a_b" / "e_f.txt").read_text() == "theirs"
+    assert (tmp_path / "x_y" / "keep.txt").is_file()
+
+
+@pytest.mark.parametrize("renameat2", [True, False])
+def test_failed_rename_does_not_stop_the_others(
+    renameat2: bool,
+    cesper_dubs: cesp.cesp,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    if not renameat2:
+        monkeypatch.setattr(cesp, "_load_renameat2", lambda: None)
+    _make_tree(tmp_path, ["a b.txt", "c d.txt", "e f.txt"])
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    og = [str(tmp_path / n) for n in ("a b.txt", "gone.txt", "c d.txt", "e f.txt")]
+    ren = [str(tmp_path / n) for n in ("a_b.txt", "gone_1.txt", "", "e_f.txt")]
+    # an empty name is the directory itself
+    ren[2] += os.sep
+    cesper_dubs.rename_list(og, ren)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "a_b.txt",
+        "c d.txt",
+        "e_f.txt",
+    ]
+    assert capsys.readouterr() == ("", "")
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_memory_file_system_matches_disk(
+    jobs: int, cesper_dubs: cesp.cesp, dirty_tree: Path
+) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setIgnoredDirs(["clean"])
+    cesper_dubs.setJobs(jobs)
+    expected = cesper_dubs.fetch()
+
+    root = os.path.join(os.sep, "memory", "tree")
+    fs = cesp.MemoryFileSystem(listdir_latency=0.001)
+    for p in dirty_tree.rglob("*"):
+        fs.add(os.path.join(root, os.path.relpath(p, dirty_tree)), is_dir=p.is_dir())
+    cesper_dubs.setFileSystem(fs)
+    cesper_dubs.setPath(root)
+    assert cesper_dubs.getIgnoredDirs() == [os.path.join(root, "clean")]
+    og, ren = cesper_dubs.fetch()
+    assert og == [f.replace(str(dirty_tree), root) for f in expected[0]]
+    assert ren == [f.replace(str(dirty_tree), root) for f in expected[1]]
+
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.rename_list(og, ren)
+    assert cesper_dubs.fetch() == ([], [])
+    assert os.path.join(root, "a_b", "c_d", "e_f.txt") in set(fs.paths())
+    assert os.path.join(root, "clean", "also clean?.txt") in set(fs.paths())
+    assert (dirty_tree / "a b" / "c d" / "e f.txt").is_file()
+
+
+def test_memory_file_system_rename_errors() -> None:
+    fs = cesp.MemoryFileSystem(["/m/a/x.txt", "/m/b/y.txt", "/m/f.txt"])
+    with pytest.raises(FileNotFoundError):
+        fs.rename("/m/missing", "/m/other")
+    with pytest.raises(OSError):
+        fs.rename("/m/a", "/m/b")
+    with pytest.raises(NotADirectoryError):
+        fs.rename("/m/a", "/m/f.txt")
+    with pytest.raises(OSError):
+        fs.rename("/m/a", "/m/a/inside")
+    assert not fs.exists("/m/f.txt/child")
+
+    fs.rename("/m/a", "/m/c")
+    fs.rename("/m/b/y.txt", "/m/f.txt")
+    assert sorted(fs.paths("/m")) == ["/m/b", "/m/c", "/m/c/x.txt", "/m/f.txt"]
+
+
+SURVEY_NAMES = ["a b.txt", "c(d).txt", "é.txt", "x.y.txt", "q#r.txt", "ok.txt"]
+
+
+def test_survey_is_exact_on_regular_trees(cesper_dubs: cesp.cesp) -> None:
+    # every probe sees the same tree, so there is nothing to estimate
+    root = os.path.join(os.sep, "survey")
+    fs = cesp.MemoryFileSystem()
+    for top in ("one", "two", "three"):
+        for sub in ("a", "b"):
+            for name in SURVEY_NAMES:
+                fs.add(os.path.join(root, top, sub, name))
+    cesper_dubs.setFileSystem(fs)
+    cesper_dubs.setPath(root)
+    cesper_dubs.setRecursive(True)
+
+    report = cesper_dubs.survey(probes=20, seed=0)
+    assert [d.value for d in report.dirs] == [1, 3, 6]
+    assert report.entries == (36, 36, 36)
+    assert report.renames == (30, 30, 30)
+    assert {name: e.value for name, e in report.rules.items()} == {
+        "utf": 6,
+        "dots": 6,
+        "brackets": 6,
+        "special_chars": 6,
+        "whitespace": 6,
+    }
+    assert report.renames.value == len(cesper_dubs.fetch()[0])
+
+    cesper_dubs.setRecursive(False)
+    report = cesper_dubs.survey(probes=20, seed=0)
+    assert report.dirs_listed == 1
+    assert report.entries.value == 0
+
+
+def test_survey_interval_covers_the_tree(cesper_dubs: cesp.cesp) -> None:
+    import random
+
+    rng = random.Random(7)
+    root = os.path.join(os.sep, "survey")
+    fs = cesp.MemoryFileSystem()
+
+    def add(path: str, depth: int) -> None:
+        fs.add(path, is_dir=True)
+        for i in range(rng.randint(0, 20)):
+            fs.add(os.path.join(path, str(i) + rng.choice(SURVEY_NAMES)))
+        for i in range(rng.randint(0, 4) if depth < 4 else 0):
+            add(os.path.join(path, "dir {}".format(i)), depth + 1)
+
+    add(root, 0)
+    cesper_dubs.setFileSystem(fs)
+    cesper_dubs.setPath(root)
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setJobs(4)
+    renames = len(cesper_dubs.fetch()[0])
+
+    report = cesper_dubs.survey(probes=500, seed=1)
+    assert report.renames.low <= renames <= report.renames.high
+    assert report.renames.low < report.renames.high
+    assert report.probes == 500
+    with pytest.raises(ValueError):
+        cesper_dubs.survey(probes=0)
+
+
+def test_journal_resume_and_undo(
+    cesper_dubs: cesp.cesp, dirty_tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    before = sorted(str(p) for p in dirty_tree.rglob("*"))
+    journal = str(dirty_tree.with_name(dirty_tree.name + ".journal"))
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setJournal(journal)
+    og, ren = cesper_dubs.fetch()
+
+    rename_new = cesp.cesp._rename_new
+    calls: List[str] = []
+
+    def interrupted_rename(
+        self: cesp.cesp, src: str, dst: str, fds: Optional["cesp._DirFds"]
+    ) -> bool:
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        calls.append(src)
+        return rename_new(self, src, dst, fds)
+
+    monkeypatch.setattr(cesp.cesp, "_rename_new", interrupted_rename)
+    with pytest.raises(KeyboardInterrupt):
+        cesper_dubs.rename_list(og, ren)
+    monkeypatch.setattr(cesp.cesp, "_rename_new", rename_new)
+
+    assert cesper_dubs.resume_journal(journal) == len(og) - 2
+    assert cesper_dubs.fetch() == ([], [])
+    assert cesper_dubs.resume_journal(journal) == 0
+
+    assert cesper_dubs.undo_journal(journal) == len(og)
+    assert sorted(str(p) for p in dirty_tree.rglob("*")) == before
+    assert cesper_dubs.undo_journal(journal) == 0
+
+
+def test_journal_resume_after_lost_and_torn_records(
+    cesper_dubs: cesp.cesp, dirty_tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    before = sorted(str(p) for p in dirty_tree.rglob("*"))
+    journal = str(dirty_tree.with_name(dirty_tree.name + ".journal"))
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setJournal(journal)
+    og, ren = cesper_dubs.fetch()
+
+    rename_new = cesp.cesp._rename_new
+    calls: List[str] = []
+
+    def interrupted_rename(
+        self: cesp.cesp, src: str, dst: str, fds: Optional["cesp._DirFds"]
+    ) -> bool:
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        calls.append(src)
+        return rename_new(self, src, dst, fds)
+
+    monkeypatch.setattr(cesp.cesp, "_rename_new", interrupted_rename)
+    with pytest.raises(KeyboardInterrupt):
+        cesper_dubs.rename_list(og, ren)
+    monkeypatch.setattr(cesp.cesp, "_rename_new", rename_new)
+
+    # the second rename landed but its record did not, and the run died in
+    # the middle of the next one
+    with open(journal, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines(keepends=True)
+    assert lines[-1].startswith('["D", ')
+    with open(journal, "w", encoding="utf-8") as f:
+        f.writelines(lines[:-1])
+        f.write('["D"')
+
+    assert cesper_dubs.resume_journal(journal) == len(og) - 2
+    assert cesper_dubs.fetch() == ([], [])
+    assert cesper_dubs.undo_journal(journal) == len(og)
+    assert sorted(str(p) for p in dirty_tree.rglob("*")) == before
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        None,
+        "not json\n",
+        '["cesp-journal", 1]\n{"P": 1}\n["B"]\n',
+        '["cesp-journal", 1]\n["P", "a", "b"]\n["B"]\n["D", 5]\n',
+    ],
+    ids=["missing", "garbage", "bad record", "bad index"],
+)
+@pytest.mark.parametrize("option", ["--undo", "--resume"])
+def test_main_reports_unusable_journals(
+    option: str,
+    content: Optional[str],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    journal = tmp_path / "journal"
+    if content is not None:
+        journal.write_text(content, encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["cesp", "-q", option, str(journal)])
+    with pytest.raises(SystemExit) as e:
+        cesp.main()
+    assert e.value.code == 1
+    action = option.lstrip("-")
+    assert capsys.readouterr().err.startswith(
+        "cesp: could not {} {}: ".format(action, journal)
+    )
+
+
+def test_rename_tree_with_streamed_journal(
+    cesper_dubs: cesp.cesp, dirty_tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    before = sorted(str(p) for p in dirty_tree.rglob("*"))
+    journal = str(dirty_tree.with_name(dirty_tree.name + ".journal"))
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setLowMemory(True)
+    cesper_dubs.setJobs(4)
+    cesper_dubs.setJournal(journal)
+    monkeypatch.setattr(cesp, "JOURNAL_SYNC_EVERY", 2)
+
+    assert cesper_dubs.rename_tree() == 7
+    assert (dirty_tree / "a_b" / "c_d" / "e_f.txt").is_file()
+    assert cesper_dubs.fetch() == ([], [])
+
+    assert cesper_dubs.undo_journal(journal) == 7
+    assert sorted(str(p) for p in dirty_tree.rglob("*")) == before
+
+
+def test_rename_iter_with_journal(cesper_dubs: cesp.cesp, dirty_tree: Path) -> None:
+    before = sorted(str(p) for p in dirty_tree.rglob("*"))
+    journal = str(dirty_tree.with_name(dirty_tree.name + ".journal"))
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    og, ren = cesper_dubs.fetch()
+    plan = str(dirty_tree.with_name(dirty_tree.name + ".plan"))
+    cesper_dubs.write_plan(plan, zip(og, ren))
+
+    cesper_dubs.setJournal(journal)
+    assert cesper_dubs.rename_iter(cesper_dubs.read_plan(plan)) == len(og)
+    assert cesper_dubs.fetch() == ([], [])
+    assert cesper_dubs.undo_journal(journal) == len(og)
+    assert sorted(str(p) for p in dirty_tree.rglob("*")) == before
+
+
+def _low_memory_peak(root: Path, dirs: int, width: int) -> int:
+    for d in range(dirs):
+        _make_tree(root / f"dir {d}", [f"sub dir/file {f}.txt" for f in range(width)])
+    cesper = cesp.cesp()
+    cesper.setPath(str(root))
+    cesper.setRecursive(True)
+    cesper.setChange(cesp.ChangeItemMode.all)
+    cesper.setNoChange(False)
+    cesper.setQuiet(True)
+    cesper.setLowMemory(True)
+    # the name cache is bounded on its own, leave it out of the measure
+    cesper.setNameCacheSize(0)
+    cesper._get_converter()
+
+    tracemalloc.start()
+    try:
+        assert cesper.rename_tree() == dirs * (width + 2)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_rename_tree_memory_does_not_grow_with_the_tree(tmp_path: Path) -> None:
+    width = 100
+    small = _low_memory_peak(tmp_path / "small", 5, width)
+    large = _low_memory_peak(tmp_path / "large", 40, width)
+
+    # 8 times the entries, but the same depth and width
+    assert large < 1.5 * small
+    assert large < 2000 * width
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        (cesp.CollisionPolicy.skip, ["c d.txt"]),
+        (cesp.CollisionPolicy.suffix, ["a b.txt", "c d.txt", "c  d.txt"]),
+    ],
+)
+def test_collisions_are_found_while_fetching(
+    policy: cesp.CollisionPolicy,
+    expected: List[str],
+    cesper: cesp.cesp,
+    tmp_path: Path,
+) -> None:
+    _make_tree(tmp_path, ["a b.txt", "a_b.txt", "c d.txt", "c  d.txt"])
+    cesper.setPath(str(tmp_path))
+    cesper.setCollisionPolicy(policy)
+    og, ren = cesper.fetch()
+
+    assert sorted(os.path.basename(f) for f in og) == sorted(expected)
+    assert len(set(ren)) == len(ren)
+    assert sorted(os.path.basename(c.target) for c in cesper.getCollisions()) == [
+        "a_b.txt",
+        "c_d.txt",
+    ]
+    if policy == cesp.CollisionPolicy.suffix:
+        assert str(tmp_path / "a_b_1.txt") in ren
+
+
+@pytest.mark.parametrize("policy", list(cesp.CollisionPolicy))
+def test_empty_target_names_are_collisions(
+    policy: cesp.CollisionPolicy, cesper: cesp.cesp, tmp_path: Path
+) -> None:
+    # "_" and " " both convert to ""
+    _make_tree(tmp_path, ["_", "sub/ ", "a b"])
+    cesper.setPath(str(tmp_path))
+    cesper.setRecursive(True)
+    cesper.setChange(cesp.ChangeItemMode.all)
+    cesper.setNoChange(False)
+    cesper.setQuiet(True)
+    cesper.setCollisionPolicy(policy)
+    if policy == cesp.CollisionPolicy.abort:
+        with pytest.raises(cesp.CollisionError):
+            cesper.fetch()
+        with pytest.raises(cesp.CollisionError):
+            list(cesper.convert_paths([str(tmp_path / "_")]))
+        return
+
+    og, ren = cesper.fetch()
+    assert sorted(c.original for c in cesper.getCollisions()) == [
+        str(tmp_path / "_"),
+        str(tmp_path / "sub" / " "),
+    ]
+    cesper.rename_list(og, ren)
+    if policy == cesp.CollisionPolicy.suffix:
+        assert (tmp_path / "_1").is_file()
+        assert (tmp_path / "sub" / "_1").is_file()
+    else:
+        assert (tmp_path / "_").is_file()
+        assert (tmp_path / "sub" / " ").is_file()
+    assert (tmp_path / "a_b").is_file()
+
+    pairs = list(cesper.convert_paths([str(tmp_path / "c d"), str(tmp_path / "__")]))
+    suffixed = [(str(tmp_path / "__"), str(tmp_path / "_1"))]
+    expected = suffixed if policy == cesp.CollisionPolicy.suffix else []
+    assert pairs == [(str(tmp_path / "c d"), str(tmp_path / "c_d"))] + expected
+    assert [c.original for c in cesper.getCollisions()] == [str(tmp_path / "__")]
+
+
+def test_collision_abort(cesper: cesp.cesp, tmp_path: Path) -> None:
+    _make_tree(tmp_path, ["a b.txt", "a_b.txt", "c d.txt"])
+    cesper.setPath(str(tmp_path))
+    cesper.setCollisionPolicy(cesp.CollisionPolicy.abort)
+    with pytest.raises(cesp.CollisionError) as e:
+        cesper.fetch()
+    assert [c.original for c in e.value.collisions] == [str(tmp_path / "a b.txt")]
+
+
+ARCHIVE_MEMBERS = {
+    "a b/c d.txt": b"first",
+    "a b/.hidden file": b"hidden",
+    "a b/e f.bin": b"\0" * 4096,
+    "a b/coração final.txt": b"third",
+    "x y.txt": b"second",
+    "x_y.txt": b"taken",
+}
+
+
+def _make_archive(kind: str, path: Path) -> None:
+    if kind == "zip":
+        import zipfile
+
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("a b/", b"")
+            for name, data in ARCHIVE_MEMBERS.items():
+                z.writestr(name, data)
+    elif kind == "tar.gz":
+        import tarfile
+
+        with tarfile.open(path, "w:gz") as t:
+            directory = tarfile.TarInfo("a b")
+            directory.type = tarfile.DIRTYPE
+            t.addfile(directory)
+            for name, data in ARCHIVE_MEMBERS.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                t.addfile(info, io.BytesIO(data))
+    else:
+        with py7zr.SevenZipFile(path, "w") as z:
+            for name, data in ARCHIVE_MEMBERS.items():
+                z.writef(io.BytesIO(data), name)
+
+
+def _read_archive(kind: str, path: Path) -> Dict[str, bytes]:
+    if kind == "zip":
+        import zipfile
+
+        with zipfile.ZipFile(path) as z:
+            assert z.testzip() is None
+            return {i.filename: z.read(i) for i in z.infolist() if not i.is_dir()}
+    if kind == "tar.gz":
+        import tarfile
+
+        with tarfile.open(path, "r:gz") as t:
+            return {
+                m.name: t.extractfile(m).read() for m in t if m.isreg()  # type: ignore
+            }
+    with py7zr.SevenZipFile(path) as z:
+        contents = cesp._read_7z(z, {})
+    return {n: f.getvalue() for n, f in contents.items()}  # type: ignore
+
+
+@pytest.mark.parametrize("kind", ["zip", "tar.gz", "7z"])
+def test_rename_archive(cesper_dubs: cesp.cesp, tmp_path: Path, kind: str) -> None:
+    source = tmp_path / f"source.{kind}"
+    output = tmp_path / f"output.{kind}"
+    _make_archive(kind, source)
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setCollisionPolicy(cesp.CollisionPolicy.suffix)
+
+    pairs = dict(cesper_dubs.rename_archive(str(source), str(output)))
+    assert not output.exists()
+    assert pairs["a b/c d.txt"] == "a_b/c_d.txt"
+    assert pairs["x y.txt"] == "x_y_1.txt"
+    assert pairs["a b/.hidden file"] == "a_b/.hidden file"
+    # kept in a pax header by tar
+    assert pairs["a b/coração final.txt"] == "a_b/coracao_final.txt"
+
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.rename_archive(str(source), str(output))
+    renamed = _read_archive(kind, output)
+    assert renamed == {pairs.get(n, n): d for n, d in ARCHIVE_MEMBERS.items()}
+    assert _read_archive(kind, source) == ARCHIVE_MEMBERS
+
+
+@pytest.mark.skipif(shutil.which("zip") is None, reason="needs the zip command")
+def test_rename_archive_keeps_encrypted_members(
+    cesper_dubs: cesp.cesp, tmp_path: Path
+) -> None:
+    import zipfile
+
+    _make_tree(tmp_path / "src", ["a b/c d.txt", "x y.txt"])
+    (tmp_path / "src" / "a b" / "c d.txt").write_bytes(b"secret")
+    source = tmp_path / "source.zip"
+    subprocess.run(
+        ["zip", "-q", "-P", "pw", "-r", str(source), "a b", "x y.txt"],
+        cwd=tmp_path / "src",
+        check=True,
+    )
+    output = tmp_path / "output.zip"
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.rename_archive(str(source), str(output))
+
+    with zipfile.ZipFile(output) as z:
+        assert z.getinfo("a_b/c_d.txt").flag_bits & 0x01
+        assert z.read("a_b/c_d.txt", pwd=b"pw") == b"secret"
+        assert z.read("x_y.txt", pwd=b"pw") == b""
+
+
+def test_rename_archive_policies(cesper_dubs: cesp.cesp, tmp_path: Path) -> None:
+    source = tmp_path / "source.zip"
+    _make_archive("zip", source)
+    cesper_dubs.setNoChange(False)
+
+    # only the top level without recursion, x y.txt is skipped
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    pairs = cesper_dubs.rename_archive(str(source), str(tmp_path / "top.zip"))
+    assert dict(pairs) == {
+        "a b": "a_b",
+        "a b/c d.txt": "a_b/c d.txt",
+        "a b/.hidden file": "a_b/.hidden file",
+        "a b/e f.bin": "a_b/e f.bin",
+        "a b/coração final.txt": "a_b/coração final.txt",
+    }
+    assert [c.original for c in cesper_dubs.getCollisions()] == ["x y.txt"]
+    assert "x y.txt" in _read_archive("zip", tmp_path / "top.zip")
+
+    cesper_dubs.setCollisionPolicy(cesp.CollisionPolicy.abort)
+    with pytest.raises(cesp.CollisionError):
+        cesper_dubs.rename_archive(str(source), str(tmp_path / "abort.zip"))
+    assert not (tmp_path / "abort.zip").exists()
+    with pytest.raises(ValueError):
+        cesper_dubs.rename_archive(str(source), str(source))
+
+
+def test_plan_and_apply_do_not_print(
+    cesper_dubs: cesp.cesp, dirty_tree: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    (dirty_tree / "a_b.txt").touch()
+    (dirty_tree / "a b.txt").touch()
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setCollisionPolicy(cesp.CollisionPolicy.suffix)
+    cesper_dubs.setNoChange(False)
+
+    entries = list(cesper_dubs.plan())
+    kinds = {os.path.basename(e.original): e.kind for e in entries}
+    assert kinds["a b"] == "dir"
+    assert kinds["e f.txt"] == "file"
+    suffixed = [e for e in entries if e.reason == "suffix"]
+    assert [os.path.basename(e.target) for e in suffixed] == ["a_b_1.txt"]
+
+    # make one of them fail
+    os.remove(dirty_tree / "x y.txt")
+    results = list(cesper_dubs.apply(entries))
+    statuses = {os.path.basename(r.entry.original): r.status for r in results}
+    assert statuses["x y.txt"] == cesp.RenameStatus.failed
+    assert statuses["a b"] == cesp.RenameStatus.renamed
+    assert (dirty_tree / "a_b_1.txt").is_file()
+    assert capsys.readouterr() == ("", "")
+
+
+def test_afetch_matches_iter_fetch(
+    cesper_dubs: cesp.cesp, dirty_tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+
+    async def collect(limit: int) -> List[Tuple[str, str]]:
+        pairs = []
+        async for pair in cesper_dubs.afetch(max_pending=1):
+            pairs.append(pair)
+            if len(pairs) == limit:
+                break
+        return pairs
+
+    monkeypatch.setattr(cesp, "ASYNC_BATCH_SIZE", 1)
+    expected = list(cesper_dubs.iter_fetch())
+    assert asyncio.run(collect(-1)) == expected
+    # stopping early must not leave the walk blocked on the queue
+    assert asyncio.run(collect(2)) == expected[:2]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_afetch_cancels_a_walk_with_nothing_to_rename(
+    jobs: int, cesper_dubs: cesp.cesp
+) -> None:
+    root = os.path.join(os.sep, "clean")
+    fs = cesp.MemoryFileSystem(listdir_latency=0.005)
+    for i in range(1000):
+        path = os.path.join(root, "dir_{}".format(i // 20), "sub_{}".format(i))
+        fs.add(path, is_dir=True)
+    cesper_dubs.setFileSystem(fs)
+    cesper_dubs.setPath(root)
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setJobs(jobs)
+
+    async def cancel() -> float:
+        async def consume() -> None:
+            async for _ in cesper_dubs.afetch():
+                pass
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.1)
+        start = time.perf_counter()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return time.perf_counter() - start
+
+    # the whole walk takes seconds, even with four jobs
+    assert asyncio.run(cancel()) < 0.5
+    cesper_dubs.close()
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_arename_list(jobs: int, cesper_dubs: cesp.cesp, dirty_tree: Path) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setJobs(jobs)
+    og, ren = cesper_dubs.fetch()
+
+    asyncio.run(cesper_dubs.arename_list(og, ren))
+    assert (dirty_tree / "a_b" / "c_d" / "e_f.txt").is_file()
+    assert cesper_dubs.fetch() == ([], [])
+
+
+def _wait_for(path: Path, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.mark.parametrize("backend", [cesp.WatchBackend.inotify, cesp.WatchBackend.poll])
+def test_watch_renames_new_entries(
+    backend: cesp.WatchBackend,
+    monkeypatch: pytest.MonkeyPatch,
+    cesper_dubs: cesp.cesp,
+    dirty_tree: Path,
+) -> None:
+    if backend == cesp.WatchBackend.inotify and not sys.platform.startswith("linux"):
+        pytest.skip("inotify is Linux only")
+    monkeypatch.setattr(cesp, "WATCH_POLL_INTERVAL", 0.02)
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setWatchBackend(backend)
+    cesper_dubs.setWatchDebounce(0.02)
+    journal = str(dirty_tree.with_name(dirty_tree.name + ".journal"))
+    cesper_dubs.setJournal(journal)
+
+    passes: List[int] = []
+    stop = threading.Event()
+    watcher = threading.Thread(target=cesper_dubs.watch, args=(passes.append, stop))
+    watcher.start()
+    try:
+        # initial pass
+        assert _wait_for(dirty_tree / "a_b" / "c_d" / "e_f.txt")
+        # a new file inside a directory renamed by the initial pass
+        (dirty_tree / "a_b" / "c_d" / "new file.txt").touch()
+        assert _wait_for(dirty_tree / "a_b" / "c_d" / "new_file.txt")
+        # a whole new tree moved in at once
+        outside = dirty_tree.with_name(dirty_tree.name + ".staging")
+        _make_tree(outside, ["new dir/inner dir/deep file.txt"])
+        os.rename(outside / "new dir", dirty_tree / "clean" / "new dir")
+        assert _wait_for(
+            dirty_tree / "clean" / "new_dir" / "inner_dir" / "deep_file.txt"
+        )
+    finally:
+        stop.set()
+        watcher.join()
+
+    assert passes[0] == 7
+    assert sum(passes) == 7 + 1 + 3
+    assert cesper_dubs.fetch() == ([], [])
+
+    # every pass went to the same journal
+    assert cesper_dubs.undo_journal(journal) == 7 + 1 + 3
+    assert (dirty_tree / "a b" / "c d" / "new file.txt").is_file()
+    assert (dirty_tree / "clean" / "new dir" / "inner dir" / "deep file.txt").is_file()
+
+
+def test_watch_abort_reports_applied_renames(
+    monkeypatch: pytest.MonkeyPatch,
+    cesper_dubs: cesp.cesp,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    collision = cesp.Collision("/w/a b", "/w/a_b", None)
+
+    def watch(callback: Callable[[int], None]) -> int:
+        # the initial pass renamed 3 entries, the next one collides
+        callback(3)
+        raise cesp.CollisionError([collision])
+
+    monkeypatch.setattr(cesper_dubs, "watch", watch)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setNoChange(False)
+    with pytest.raises(SystemExit):
+        cesp._watch(cesper_dubs)
+    assert capsys.readouterr().err == (
+        "cesp: 1 name collisions found. Aborted, 3 renames were already applied, "
+        "no further changes were made\n"
+    )
+
+    cesper_dubs.setNoChange(True)
+    with pytest.raises(SystemExit):
+        cesp._watch(cesper_dubs)
+    assert capsys.readouterr().err.endswith("Aborted, no changes were made\n")
+
+
+def test_startup_does_not_import_heavy_modules(tmp_path: Path) -> None:
+    heavy = ["rich", "asyncio", "sqlite3", "concurrent", "argparse", "json", "hashlib"]
+    check = "; ".join(
+        [
+            "import sys",
+            "{}",
+            "loaded = {{m.split('.')[0] for m in sys.modules}}",
+            "print(' '.join(m for m in {!r} if m in loaded))".format(heavy),
+        ]
+    )
+    run_quiet = "sys.argv = ['cesp', '-q', '-n', {!r}]; cesp.main()".format(
+        str(tmp_path)
+    )
+    for code in ["import cesp", "import cesp; " + run_quiet]:
+        result = subprocess.run(
+            [sys.executable, "-c", check.format(code)],
+            cwd=str(Path(cesp.__file__).parent),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        loaded = result.stdout.split()
+        if "cesp.main" in code:
+            # a quiet run may need argparse, but never rich
+            loaded = [m for m in loaded if m != "argparse"]
+        assert loaded == []
+
+
+def test_read_roots_keeps_spaces(tmp_path: Path) -> None:
+    roots = tmp_path / "roots"
+    roots.write_text("/data/one\n\n /data/two \n", encoding="utf-8")
+    assert cesp._read_roots(str(roots)) == ["/data/one", " /data/two "]
+
+
+def test_batch_resolves_ignored_dirs_per_root(
+    cesper_dubs: cesp.cesp, tmp_path: Path
+) -> None:
+    for root in ["one", "two"]:
+        _make_tree(
+            tmp_path / root, ["a b.txt", "skip me/c d.txt", "sub/skip me/e f.txt"]
+        )
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    cesper_dubs.setJobs(2)
+    cesper_dubs.setIgnoredDirs(["skip me"])
+    roots = [str(tmp_path / "one"), str(tmp_path / "missing"), str(tmp_path / "two")]
+
+    reports = list(cesper_dubs.batch(roots))
+    cesper_dubs.close()
+
+    assert [r.path for r in reports] == roots
+    assert [r.renames for r in reports] == [2, 0, 2]
+    assert [r.error is None for r in reports] == [True, False, True]
+    for root in ["one", "two"]:
+        assert (tmp_path / root / "a_b.txt").is_file()
+        assert (tmp_path / root / "skip me" / "c d.txt").is_file()
+        assert (tmp_path / root / "sub" / "skip me" / "e_f.txt").is_file()
+
+
+def test_process_pool_conversion_keeps_walk_order(
+    cesper_dubs: cesp.cesp, dirty_tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _make_tree(dirty_tree, [f"many/name {i}.txt" for i in range(50)])
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    expected_fetch = cesper_dubs.fetch()
+    expected_plan = list(cesper_dubs.plan())
+
+    cesper_dubs.setProcesses(2)
+    # too few names to be worth starting the pool
+    assert cesper_dubs.fetch() == expected_fetch
+    assert cesper_dubs._process_pool is None
+
+    monkeypatch.setattr(cesp, "PROCESS_BATCH_SIZE", 4)
+    try:
+        assert cesper_dubs.fetch() == expected_fetch
+        assert list(cesper_dubs.plan()) == expected_plan
+        assert cesper_dubs._process_pool is not None
+    finally:
+        cesper_dubs.close()
+
+
+@pytest.fixture
+def rule_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("LOCALAPPDATA", str(tmp_path / "cache"))
+    cesp._fold_table.cache_clear()
+    rules = tmp_path / "rules.json"
+    rules.write_text(
+        """{
+            "fold": true,
+            "keep": ["U+F900..U+FAFF"],
+            "map": {"ß": "ss", "Æ": "AE", "ø": "o"},
+            "special": {"&": "_e_"}
+        }""",
+        encoding="utf-8",
+    )
+    return rules
+
+
+def test_rule_file(rule_file: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    builtin_utf = dict(cesp.cesp._utf_chars)
+    cesper = cesp.cesp()
+    cesper.setUTF(True)
+    cesper.setSpecialChars(True)
+    cesper.setRuleFile(str(rule_file))
+
+    name = "Straße Ærø ｆｉｌｅ café & 豈 Ç.txt"
+    assert cesper._get_converted_name(name) == "Strasse_AEro_file_cafe_e_豈_C.txt"
+    for flags in range(16):
+        cesper.setUTF(bool(flags & 1))
+        cesper.setDots(bool(flags & 2))
+        cesper.setBrackets(bool(flags & 4))
+        cesper.setSpecialChars(bool(flags & 8))
+        for name in _tricky_names + [name, "ﬁle․tar.gz", "x́.́y"]:
+            assert cesper._get_converted_name(
+                name
+            ) == cesper._get_converted_name_stepwise(name)
+
+    # loaded once and shared, the built-in rules are left alone
+    other = cesp.cesp()
+    other.setRuleFile(str(rule_file))
+    assert other._utf_chars is cesper._utf_chars
+    assert dict(cesp.cesp._utf_chars) == builtin_utf
+    assert cesp.cesp()._utf_chars is cesp.cesp._utf_chars
+    other.setRuleFile(None)
+    assert other._utf_chars is cesp.cesp._utf_chars
+
+    # the folding table comes from the disk cache the second time
+    def no_compute() -> None:
+        raise AssertionError("fold table computed again")
+
+    cesp._fold_table.cache_clear()
+    cesp._load_rules.cache_clear()
+    monkeypatch.setattr(cesp, "_compute_fold_table", no_compute)
+    assert cesp.load_rules(str(rule_file)).utf_chars == cesper._utf_chars
+
+
+@pytest.mark.parametrize(
+    "content",
+    ['{"unknown": 1}', '{"map": {"ab": "c"}}', '{"fold": true, "keep": ["4E00"]}', "["],
+)
+def test_invalid_rule_file(content: str, rule_file: Path) -> None:
+    rule_file.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError):
+        cesp.cesp().setRuleFile(str(rule_file))
+
+
+def test_stats(cesper_dubs: cesp.cesp, dirty_tree: Path) -> None:
+    cesper_dubs.setPath(str(dirty_tree))
+    cesper_dubs.setRecursive(True)
+    cesper_dubs.setChange(cesp.ChangeItemMode.all)
+    cesper_dubs.setNoChange(False)
+    cesper_dubs.setQuiet(True)
+    assert cesper_dubs.getStats() is None
+
+    cesper_dubs.setStats(True)
+    cesper_dubs.rename_list(*cesper_dubs.fetch())
+    report = cesper_dubs.getStats()
+    assert report is not None
+    assert report["counters"] == {
+        "dirs_listed": 5,
+        "entries_seen": 10,
+        "entries_hidden": 1,
+        "entries_ignored": 0,
+        "renames_planned": 7,
+    }
+    timers = report["timers"]
+    expected = {"list_dir", "convert", "fetch", "rename", "rename_list"}
+    if not cesp._DirFds.supported:
+        # the target is checked by path before each rename
+        expected.add("stat")
+    assert set(timers) == expected
+    assert timers["rename"]["count"] == 7
+    assert timers["rename"]["p50_ms"] <= timers["rename"]["p99_ms"]
+
+
+def test_stats_timer_percentiles(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(cesp, "STATS_RESERVOIR_SIZE", 500)
+    timer = cesp._Timer(0)
+    for ms in range(1, 10_001):
+        timer.add(ms / 1000)
+    report = timer.report()
+    assert report["count"] == 10_000
+    assert report["max_ms"] == 10_000
+    assert 4_000 < report["p50_ms"] < 6_000
+    assert report["p99_ms"] > 9_500